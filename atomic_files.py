@@ -0,0 +1,161 @@
+"""Crash-safe file writes: a temp file in the same directory, then an atomic rename"""
+import os
+import queue
+import logging
+import threading
+
+TEMP_SUFFIX = ".tmp"
+
+
+def temp_path_for(path):
+    """A temp name next to path, unique per process and thread"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}"
+
+
+def fsync_directory(directory):
+    """Make renames in directory durable; a no-op where directories can't be opened (Windows)"""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data, fsync=False):
+    """Write data so that path holds either its old contents or all of data, never a part.
+
+    With fsync, the data is flushed to disk before the rename, and the
+    rename before returning.
+    """
+    temp_path = temp_path_for(path)
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        fsync_directory(os.path.dirname(path))
+
+
+def remove_stale_temp_files(directory, extension=".jpg", subdirectories=()):
+    """Delete temp files left behind by an interrupted write; returns how many were removed.
+
+    Only directory itself is scanned, plus the whole tree under each of
+    subdirectories (names relative to directory).
+    """
+    removed = _remove_temp_files(directory, extension)
+    for subdirectory in subdirectories:
+        for root, _dirs, _files in os.walk(os.path.join(directory, subdirectory)):
+            removed += _remove_temp_files(root, extension)
+    return removed
+
+
+def _remove_temp_files(directory, extension):
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        name = entry.name
+        if name.endswith(TEMP_SUFFIX) and f"{extension}." in name.lower() and entry.is_file():
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+class AtomicWriter:
+    """write_atomic with a durability policy.
+
+    fsync is "off" (rename only, safe against crashes and Stop but not power
+    loss), "always" (flush every file before its rename and the directory
+    after it, before returning) or "batch" (rename right away, and flush
+    every batch_size files and their directories together on a background
+    thread). Batching keeps flushes off the writing thread; after a power
+    loss, files of the batch not yet flushed may be missing or truncated.
+    """
+
+    MODES = ("off", "batch", "always")
+
+    def __init__(self, fsync="off", batch_size=64):
+        if fsync not in self.MODES:
+            logging.warning(f"Unknown image_fsync '{fsync}', using off")
+            fsync = "off"
+        self.fsync = fsync
+        self.batch_size = max(1, batch_size)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._batches = None
+        self._flusher = None
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(fsync=cfg["image_fsync"], batch_size=int(cfg["image_fsync_batch_size"]))
+
+    def write(self, path, data):
+        write_atomic(path, data, fsync=self.fsync == "always")
+        if self.fsync != "batch":
+            return
+        with self._lock:
+            self._pending.append(path)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+            if self._flusher is None:
+                self._batches = queue.SimpleQueue()
+                self._flusher = threading.Thread(target=self._flush_batches, name="fsync", daemon=True)
+                self._flusher.start()
+        self._batches.put(batch)
+
+    def _flush_batches(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            self._sync(batch)
+
+    def _sync(self, paths):
+        directories = set()
+        for path in paths:
+            try:
+                # Windows only flushes handles opened for writing; r+b leaves the contents alone
+                with open(path, 'r+b') as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                # Replaced or deleted since; whoever did that wrote it out
+                continue
+            except OSError as e:
+                logging.error(f"Error flushing {path} to disk: {str(e)}")
+            directories.add(os.path.dirname(path))
+        for directory in directories:
+            fsync_directory(directory)
+
+    def flush(self):
+        """Flush every file written since the last batch, and wait for batches in progress"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            self._batches.put(None)
+            flusher.join()
+        if batch:
+            self._sync(batch)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,454 @@
+"""Offline benchmark: the batch engine against a local stand-in for DuckDuckGo and image hosts.
+
+    python benchmark.py --rows 1000 10000 100000
+
+The parent process generates a synthetic image corpus and serves it on
+127.0.0.1, together with a /search endpoint that answers like DDGS.images.
+Responses carry injected latency, errors, HTML pages and slow bodies,
+all chosen deterministically from --seed, so two runs see the same
+traffic. Each sheet size runs in a fresh worker process with its own
+working directory, preferences, caches and output directory, so peak RSS
+and cold-cache timings are per run. Results are printed as a table and
+written to benchmark_<timestamp>.json in the working directory.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# Image formats served by the corpus: (extension, PIL format, content type, weight)
+CORPUS_FORMATS = (
+    ("jpg", "JPEG", "image/jpeg", 6),
+    ("png", "PNG", "image/png", 2),
+    ("webp", "WEBP", "image/webp", 1),
+    ("gif", "GIF", "image/gif", 1),
+)
+CORPUS_LONG_SIDES = (320, 640, 1024, 1600, 2400, 3200)
+
+PRODUCT_WORDS = (
+    "steel", "cotton", "wireless", "organic", "ceramic", "leather", "portable", "compact",
+    "bamboo", "digital", "classic", "premium", "outdoor", "kitchen", "garden", "travel",
+    "mug", "lamp", "chair", "bottle", "charger", "blanket", "knife", "speaker",
+    "backpack", "kettle", "pillow", "scissors", "notebook", "helmet", "towel", "watch"
+)
+
+SHEET_FILENAME_COLUMN = "filename"
+SHEET_DESCRIPTION_COLUMN = "description"
+
+
+def _rng(*parts):
+    """A Random seeded from the parts, stable across processes and Python runs"""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+class SyntheticCorpus:
+    """count generated images of varied sizes and formats, kept encoded in memory"""
+
+    def __init__(self, count=200, seed=0):
+        from PIL import Image, ImageDraw
+
+        self.images = []
+        formats = [entry for entry in CORPUS_FORMATS for _ in range(entry[3])]
+        for index in range(count):
+            rng = _rng(seed, "corpus", index)
+            ext, pil_format, content_type, _ = rng.choice(formats)
+            long_side = rng.choice(CORPUS_LONG_SIDES)
+            short_side = max(1, int(long_side * rng.uniform(0.6, 1.0)))
+            size = (long_side, short_side) if rng.random() < 0.5 else (short_side, long_side)
+
+            # A gradient with shapes on it: compresses like a product photo, unlike noise
+            img = Image.linear_gradient("L").resize(size).convert("RGB")
+            draw = ImageDraw.Draw(img)
+            for _ in range(12):
+                x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+                x1, y1 = x0 + rng.randrange(1, size[0] // 2 + 2), y0 + rng.randrange(1, size[1] // 2 + 2)
+                colour = tuple(rng.randrange(256) for _ in range(3))
+                if rng.random() < 0.5:
+                    draw.rectangle((x0, y0, x1, y1), fill=colour)
+                else:
+                    draw.ellipse((x0, y0, x1, y1), fill=colour)
+            if pil_format == "GIF":
+                img = img.convert("P", palette=Image.ADAPTIVE)
+
+            output = BytesIO()
+            img.save(output, pil_format)
+            self.images.append((ext, content_type, size, output.getvalue()))
+
+    def __len__(self):
+        return len(self.images)
+
+    def total_bytes(self):
+        return sum(len(image[3]) for image in self.images)
+
+
+class Faults:
+    """Per-request fault injection; every rate is a fraction of requests"""
+
+    def __init__(self, search_latency_ms=150, download_latency_ms=80, error_rate=0.05,
+                 html_rate=0.03, slow_rate=0.03, empty_search_rate=0.02, seed=0):
+        self.search_latency = search_latency_ms / 1000
+        self.download_latency = download_latency_ms / 1000
+        self.error_rate = error_rate
+        self.html_rate = html_rate
+        self.slow_rate = slow_rate
+        self.empty_search_rate = empty_search_rate
+        self.seed = seed
+
+    @staticmethod
+    def latency(rng, median):
+        """Log-normal around median, the long-tailed shape real hosts show"""
+        return median * math.exp(rng.gauss(0, 0.6)) if median > 0 else 0.0
+
+
+class BenchmarkServer:
+    """Serves the corpus and a DDGS-like /search endpoint on 127.0.0.1 in background threads"""
+
+    def __init__(self, corpus, faults, port=0):
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                try:
+                    if url.path == "/search":
+                        self._search(parse_qs(url.query))
+                    elif url.path.startswith("/img/"):
+                        self._image(url.path[len("/img/"):])
+                    else:
+                        self._send(404, "text/plain", b"not found")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on a slow or unwanted body
+                    pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _search(self, query):
+                keywords = query.get("q", [""])[0]
+                count = int(query.get("n", ["5"])[0])
+                rng = _rng(faults.seed, "search", keywords)
+                time.sleep(faults.latency(rng, faults.search_latency))
+                results = []
+                if rng.random() >= faults.empty_search_rate:
+                    for _ in range(count):
+                        image_id = rng.randrange(2 ** 31)
+                        ext, _, size, _ = corpus.images[image_id % len(corpus)]
+                        results.append({
+                            "title": keywords,
+                            "image": f"{server.base_url}/img/{image_id}.{ext}",
+                            "thumbnail": f"{server.base_url}/img/{image_id}.{ext}",
+                            "width": size[0],
+                            "height": size[1],
+                            "source": "benchmark"
+                        })
+                self._send(200, "application/json", json.dumps(results).encode('utf-8'))
+
+            def _image(self, name):
+                image_id = int(name.split(".")[0]) if name.split(".")[0].isdigit() else 0
+                rng = _rng(faults.seed, "image", image_id)
+                time.sleep(faults.latency(rng, faults.download_latency))
+                roll = rng.random()
+                if roll < faults.error_rate:
+                    self._send(rng.choice((404, 403, 500, 503)), "text/plain", b"error")
+                    return
+                roll -= faults.error_rate
+                if roll < faults.html_rate:
+                    self._send(200, "text/html", b"<html><body>" + b"Not an image. " * 400 + b"</body></html>")
+                    return
+                roll -= faults.html_rate
+                _, content_type, _, body = corpus.images[image_id % len(corpus)]
+                if roll < faults.slow_rate:
+                    # Trickle the body out in eight pieces, under the default stall timeout
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    step = len(body) // 8 + 1
+                    for offset in range(0, len(body), step):
+                        self.wfile.write(body[offset:offset + step])
+                        self.wfile.flush()
+                        time.sleep(0.25)
+                    return
+                self._send(200, content_type, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # Clients drop keep-alive connections and abandon bodies all the time
+                pass
+
+        server = self
+        self._server = Server(("127.0.0.1", port), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="benchmark-server", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeDDGS:
+    """Stands in for duckduckgo_search.DDGS, answering from a BenchmarkServer's /search"""
+
+    base_url = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def images(self, keywords, max_results=5, safesearch="off", **kwargs):
+        from urllib.request import urlopen
+
+        query = urlencode({"q": keywords, "n": max_results})
+        with urlopen(f"{self.base_url}/search?{query}", timeout=30) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+
+def make_sheet(directory, rows, seed=0, repeat_rate=0.1):
+    """Write (or reuse) a sheet of rows products; repeat_rate of them reuse an earlier description"""
+    path = os.path.join(directory, f"sheet_{rows}.xlsx")
+    if os.path.exists(path):
+        return path
+    from openpyxl import Workbook
+
+    rng = _rng(seed, "sheet", rows)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([SHEET_FILENAME_COLUMN, SHEET_DESCRIPTION_COLUMN])
+    descriptions = []
+    for index in range(rows):
+        if descriptions and rng.random() < repeat_rate:
+            description = rng.choice(descriptions)
+        else:
+            description = " ".join(rng.choice(PRODUCT_WORDS) for _ in range(rng.randint(3, 6)))
+            description = f"{description} {index}"
+            descriptions.append(description)
+        sheet.append([f"SKU-{index:06d}", description])
+    temp_path = f"{path}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+    return path
+
+
+def _peak_rss_mb():
+    """(this process, largest waited-for child) peak resident set size in MB; None where unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / (1024 * 1024)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / (1024 * 1024)
+    return own, children
+
+
+def run_worker(args):
+    """One benchmark run, inside its working directory; writes the result JSON"""
+    import config
+    from engine import BatchEngine
+    from lazy_loader import LazyLoader
+    from log_setup import setup_logging, stop_logging
+
+    settings = config.load_config()
+    # The app's own logging pipeline, minus the console, so its cost is part of the numbers
+    setup_logging(settings, log_dir="logs", console=False)
+    FakeDDGS.base_url = args.base_url
+    LazyLoader._ddgs = FakeDDGS
+
+    engine = BatchEngine(
+        excel_path=args.sheet,
+        output_dir=settings["download_directory"],
+        filename_column=SHEET_FILENAME_COLUMN,
+        description_column=SHEET_DESCRIPTION_COLUMN,
+        max_size=args.max_size,
+        concurrent_limit=args.concurrency,
+        skip_existing=True,
+        settings=settings
+    )
+    started = time.monotonic()
+    engine.run()
+    wall = time.monotonic() - started
+    stop_logging()
+
+    # Transcoder processes are reaped by now, so RUSAGE_CHILDREN covers them
+    peak_rss, peak_rss_children = _peak_rss_mb()
+    metrics = engine.metrics.snapshot()
+    progress = metrics["rows"]
+    result = {
+        "rows": progress.get("completed", 0),
+        "wall_seconds": wall,
+        "rows_per_second": progress.get("completed", 0) / wall if wall > 0 else 0.0,
+        "succeeded": progress.get("succeeded", 0),
+        "failed": progress.get("failed", 0),
+        "bytes_downloaded": metrics["bytes_downloaded"],
+        "peak_rss_mb": peak_rss,
+        "peak_rss_children_mb": peak_rss_children,
+        "stages": metrics["stages"],
+        "variations": metrics["variations"],
+        "searches": engine.search_requests,
+        "searches_saved": engine.searches_saved,
+        "candidates_rejected": engine.candidates_rejected
+    }
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    return 0
+
+
+def _run_settings(args):
+    """Preferences for a worker run; everything else keeps its default"""
+    return {
+        "download_directory": "out",
+        "cache_directory": "cache",
+        "metrics_directory": ".",
+        "download_backend": args.backend,
+        "pipeline_mode": args.pipeline,
+        "hedged_search": args.hedged,
+        "log_level": args.log_level,
+        "hot_path_log_level": args.hot_path_log_level,
+        # The stand-in never rate-limits, so let the limiter run as fast as the engine asks
+        "search_rate_initial": args.search_rate,
+        "search_rate_max": args.search_rate,
+        # The corpus repeats images across products, which would all count as duplicates
+        "skip_duplicate_images": False
+    }
+
+
+def _format_row(result):
+    row = result["stages"]["row"]
+    fetch = result["stages"]["fetch"]
+    search = result["stages"]["search"]
+    rss = result["peak_rss_mb"]
+    children = result["peak_rss_children_mb"]
+    return (
+        f"{result['rows']:>8} {result['wall_seconds']:>9.1f} {result['rows_per_second']:>8.1f} "
+        f"{result['succeeded']:>7}/{result['failed']:<7} "
+        f"{row['p50']:>6.2f}/{row['p95']:.2f}/{row['p99']:.2f} "
+        f"{search['p95']:>9.3f} {fetch['p95']:>9.3f} "
+        f"{result['bytes_downloaded'] / (1024 * 1024):>8.1f} "
+        f"{rss if rss is not None else float('nan'):>8.0f} "
+        f"{children if children is not None else float('nan'):>8.0f}"
+    )
+
+
+def run_benchmark(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    workdir = os.path.abspath(args.workdir)
+    print(f"Generating a corpus of {args.corpus} images...", flush=True)
+    corpus = SyntheticCorpus(args.corpus, seed=args.seed)
+    faults = Faults(
+        search_latency_ms=args.search_latency_ms,
+        download_latency_ms=args.download_latency_ms,
+        error_rate=args.error_rate,
+        html_rate=args.html_rate,
+        slow_rate=args.slow_rate,
+        seed=args.seed
+    )
+    server = BenchmarkServer(corpus, faults)
+    print(f"Serving {corpus.total_bytes() / (1024 * 1024):.1f} MB of images on {server.base_url}", flush=True)
+
+    results = []
+    try:
+        for rows in args.rows:
+            sheet = make_sheet(workdir, rows, seed=args.seed)
+            run_dir = os.path.join(workdir, f"run_{rows}")
+            # Every run starts cold: no caches, no journal, no existing images
+            shutil.rmtree(run_dir, ignore_errors=True)
+            os.makedirs(run_dir)
+            with open(os.path.join(run_dir, "user_preferences.json"), 'w', encoding='utf-8') as f:
+                json.dump(_run_settings(args), f, indent=4)
+
+            print(f"Running {rows} rows...", flush=True)
+            result_path = os.path.join(run_dir, "result.json")
+            command = [
+                sys.executable, os.path.abspath(__file__), "--worker",
+                "--sheet", sheet, "--base-url", server.base_url, "--result", result_path,
+                "--max-size", str(args.max_size), "--concurrency", str(args.concurrency)
+            ]
+            completed = subprocess.run(command, cwd=run_dir)
+            if completed.returncode != 0 or not os.path.exists(result_path):
+                print(f"Run of {rows} rows failed (exit code {completed.returncode}); see {run_dir}", flush=True)
+                continue
+            with open(result_path, encoding='utf-8') as f:
+                results.append(json.load(f))
+    finally:
+        server.close()
+
+    print()
+    print(f"{'rows':>8} {'wall s':>9} {'rows/s':>8} {'ok/failed':^15} {'row p50/p95/p99 s':>18} "
+          f"{'search p95':>9} {'fetch p95':>9} {'MB':>8} {'RSS MB':>8} {'pool RSS':>8}")
+    for result in results:
+        print(_format_row(result))
+
+    report_path = os.path.join(workdir, f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+    print(f"\nReport written to {report_path}", flush=True)
+    return 0 if len(results) == len(args.rows) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the batch engine offline against a local search and image server"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Sheet sizes to run, one run each")
+    parser.add_argument("--workdir", default="benchmark_runs",
+                        help="Where sheets, run directories and reports are kept")
+    parser.add_argument("--corpus", type=int, default=200, help="Number of distinct synthetic images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--max-size", type=int, default=800)
+    parser.add_argument("--backend", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--pipeline", choices=["threads", "staged"], default="threads")
+    parser.add_argument("--hedged", action="store_true")
+    parser.add_argument("--search-rate", type=float, default=1000.0,
+                        help="Search rate limit in requests per second")
+    parser.add_argument("--search-latency-ms", type=float, default=150)
+    parser.add_argument("--download-latency-ms", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of downloads answered with 4xx/5xx")
+    parser.add_argument("--html-rate", type=float, default=0.03, help="Share of downloads answered with an HTML page")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="Share of downloads trickled out slowly")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="DEBUG",
+                        help="Level of the run's log file (the app logs at DEBUG)")
+    parser.add_argument("--hot-path-log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="Level of per-row and per-candidate messages")
+    # Internal: one run inside a worker process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--sheet", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return run_worker(args)
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
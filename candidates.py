@@ -0,0 +1,152 @@
+"""Cheap checks that drop unusable image candidates before their full download"""
+import threading
+from lazy_loader import LazyLoader
+from imaging import sniff_format
+from log_setup import hot_log
+
+
+def _dimensions(result):
+    """(width, height) from a search result, or None if DuckDuckGo did not report them"""
+    try:
+        width, height = int(result.get("width") or 0), int(result.get("height") or 0)
+    except (TypeError, ValueError):
+        return None
+    return (width, height) if width > 0 and height > 0 else None
+
+
+class CandidateFilter:
+    """Ranks search results and screens downloads while they start.
+
+    Results whose reported size is too small or too large are dropped, and
+    the rest are ordered so images at least target_size on their long side
+    come before ones that would need upscaling. When a download starts, its
+    Content-Type is checked, then the first bytes are matched against the
+    supported image signatures and fed to an incremental parser until the
+    image header (and so its size) is known, looking at most sniff_bytes
+    into the body. The transfer is abandoned as soon as it shows something
+    that is not a supported image, or one of the wrong size.
+    Rejected URLs are remembered for the rest of the run, so rows that get
+    the same result do not download it again.
+    """
+
+    def __init__(self, min_dimension=100, max_pixels=50_000_000, sniff_bytes=65536):
+        self.min_dimension = min_dimension
+        self.max_pixels = max_pixels
+        self.sniff_bytes = sniff_bytes
+        self.rejected = 0
+        self._rejected_urls = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            min_dimension=int(cfg["candidate_min_dimension"]),
+            max_pixels=int(float(cfg["candidate_max_megapixels"]) * 1_000_000),
+            sniff_bytes=int(cfg["candidate_sniff_bytes"])
+        )
+
+    def _size_problem(self, size):
+        width, height = size
+        if min(width, height) < self.min_dimension:
+            return f"too small ({width}x{height})"
+        if width * height > self.max_pixels:
+            return f"too large ({width}x{height})"
+        return None
+
+    def _reject(self, url, reason):
+        with self._lock:
+            self.rejected += 1
+            self._rejected_urls.add(url)
+        hot_log.debug("Rejected candidate %s: %s", url, reason)
+
+    def rank(self, results, target_size):
+        """Candidate URLs in the order to try them, without those ruled out by their metadata"""
+        preferred, smaller = [], []
+        for result in results:
+            url = result.get("image")
+            if not url or url in self._rejected_urls:
+                continue
+            size = _dimensions(result)
+            if size is None:
+                preferred.append(url)
+                continue
+            problem = self._size_problem(size)
+            if problem:
+                self._reject(url, problem)
+            elif max(size) >= target_size:
+                preferred.append(url)
+            else:
+                smaller.append(url)
+        return preferred + smaller
+
+    def start(self, url, headers):
+        """Screening for one download; None if its Content-Type already rules it out"""
+        content_type = (headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type and not content_type.startswith("image/") and content_type != "application/octet-stream":
+            self._reject(url, f"content type {content_type}")
+            return None
+        return Screening(self, url)
+
+
+class Screening:
+    """Checks a download's first chunks while they arrive.
+
+    Only the header is parsed: once ImageFile.Parser knows the image size,
+    no more data is fed to it, so the real decode still happens once, in
+    the transcoder.
+    """
+
+    # WebP needs 12 bytes to be recognised; the other signatures fewer
+    SIGNATURE_BYTES = 12
+
+    def __init__(self, screen, url):
+        self.screen = screen
+        self.url = url
+        self.head = b""
+        self.parser = None
+        self.fed = 0
+        self.checked = False
+
+    def feed(self, chunk):
+        """Look at the next chunk; False means stop downloading, the candidate was rejected"""
+        if self.checked:
+            return True
+        if self.parser is None:
+            self.head += chunk
+            if len(self.head) < self.SIGNATURE_BYTES:
+                return True
+            image_format = sniff_format(self.head)
+            if image_format is None:
+                self.screen._reject(self.url, "not an image")
+                return False
+            self.parser = LazyLoader.image_file().Parser()
+            chunk, self.head = self.head, b""
+
+        try:
+            self.parser.feed(chunk)
+        except LazyLoader.image().DecompressionBombError:
+            # Pillow refuses the header itself: far past any sane size
+            self.checked = True
+            self.screen._reject(self.url, "too large (decompression bomb)")
+            return False
+        except Exception:
+            # Unusual header; let the full decode decide
+            self.checked = True
+            return True
+        self.fed += len(chunk)
+        if self.parser.image is not None:
+            self.checked = True
+            problem = self.screen._size_problem(self.parser.image.size)
+            if problem:
+                self.screen._reject(self.url, problem)
+                return False
+        elif self.fed >= self.screen.sniff_bytes:
+            self.checked = True
+        return True
+
+    def finish(self):
+        """False if the body was too short to pass the signature check"""
+        if self.parser is None and sniff_format(self.head) is None:
+            self.screen._reject(self.url, "not an image")
+            return False
+        return True
@@ -8,7 +8,67 @@ DEFAULT_CONFIG = {
     "max_size": "800",
     "concurrent_downloads": "3",
     "skip_existing": True,
-    "download_directory": "downloaded_images"  # Default download directory
+    "download_directory": "downloaded_images",  # Default download directory
+    "cache_directory": "cache",
+    "search_cache_enabled": True,
+    "search_cache_ttl_hours": 168,
+    "search_cache_max_entries": 50000,
+    "query_sharing_enabled": True,  # search each query once per batch run
+    "query_sharing_max_entries": 20000,
+    "search_rate_initial": 1.0,  # DuckDuckGo searches per second, adapted at runtime
+    "search_rate_min": 0.2,
+    "search_rate_max": 4.0,
+    "search_rate_increase": 0.05,
+    "search_backoff_seconds": 5,
+    "search_backoff_max_seconds": 120,
+    "search_rate_limit_retries": 6,
+    "download_cache_enabled": True,
+    "download_cache_max_mb": 2048,
+    "download_cache_revalidate_hours": 720,
+    "download_backend": "threads",  # "threads" (requests) or "asyncio" (aiohttp)
+    "download_timeout": 30,  # total seconds per download; read_timeout bounds each stall
+    "http_pool_connections": 32,  # number of hosts to keep connection pools for
+    "http_pool_maxsize": 8,  # connections per host
+    "http_retries": 3,  # retries on connection and read errors
+    "http_status_retries": 1,  # retries on 429 and 5xx; a candidate answering 5xx is usually dead
+    "http_backoff_factor": 0.5,
+    "http_backoff_max": 4,  # longest wait between retries, in seconds
+    "http_retry_after_max": 10,  # longest Retry-After wait honoured, in seconds
+    "connect_timeout": 5,
+    "read_timeout": 10,
+    "async_max_in_flight": 256,
+    "async_limit_per_host": 8,
+    "async_prefetch": 3,
+    "submission_window_factor": 4,  # rows in flight per worker thread
+    "candidate_prefilter": True,  # drop candidates by reported size, headers and first bytes
+    "candidate_min_dimension": 100,  # pixels, shorter side
+    "candidate_max_megapixels": 50,
+    "candidate_sniff_bytes": 65536,  # how far into the body to look for the image header
+    "max_download_mb": 20,  # downloads are abandoned past this size (0 = no limit)
+    "skip_duplicate_images": True,  # skip candidates that look like another product's image
+    "duplicate_max_distance": 4,  # dHash bits that may differ for two images to count as the same
+    "thumbnail_cache_enabled": True,  # gallery thumbnails in .thumbnails/ next to the images
+    "hedged_search": False,  # search all variations at once and race the top candidates
+    "hedge_workers": 16,
+    "hedge_candidates": 2,  # downloads started per variation when its search returns
+    "metrics_directory": "logs",  # where run_metrics_<time>.json is written ("" = don't write)
+    "metrics_port": 0,  # serve live metrics on http://127.0.0.1:<port>/metrics (0 = off)
+    "log_level": "DEBUG",  # level of the log file and console
+    "hot_path_log_level": "INFO",  # per-row and per-candidate messages; WARNING keeps large runs quiet
+    "log_repeat_limit": 50,  # messages per call site per window before the rest are dropped (0 = no limit)
+    "log_repeat_window": 10,  # seconds
+    "row_log_enabled": True,  # one JSON line per finished row in logs/rows_<time>.jsonl
+    "pipeline_mode": "threads",  # "threads" (one worker per row) or "staged"
+    "search_workers": 2,
+    "fetch_workers": 8,
+    "encode_workers": 0,  # 0 = one process per CPU core
+    "process_pool_transcoding": True,
+    "transcode_timeout": 60,  # seconds to wait for an encode process before encoding in-process
+    "stage_queue_size": 64,
+    "image_fsync": "off",  # "off", "batch" or "always": when saved images are flushed to disk
+    "image_fsync_batch_size": 64,
+    "journal_enabled": True,
+    "resume_interrupted_runs": True
 }
 
 CONFIG_FILE = "user_preferences.json"
@@ -28,6 +88,21 @@ def load_config():
         logging.error(f"Error loading config: {e}")
         return DEFAULT_CONFIG.copy()
 
+def update_config(changes):
+    """Save changes on top of the keys already in the file, leaving the rest at their defaults.
+
+    Defaults are never written out, so a later change to DEFAULT_CONFIG still
+    reaches users who never set that key themselves.
+    """
+    saved = {}
+    try:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+    except Exception as e:
+        logging.error(f"Error loading config: {e}")
+    save_config({**saved, **changes})
+
 def save_config(config):
     """Save user preferences to JSON file"""
     try:
@@ -0,0 +1,117 @@
+"""Persistent filename -> description index of the input spreadsheets"""
+import os
+import sqlite3
+import logging
+import threading
+import config
+from engine import normalize_filename
+from row_source import iter_rows
+
+
+class DescriptionIndex:
+    """Maps output file names to their descriptions, one table per sheet and column pair.
+
+    A sheet is parsed once and its rows are stored in SQLite under the
+    cache directory, together with the sheet's mtime and size. Later
+    lookups, including those from other sessions, hit the index directly.
+    A sheet is parsed again only after it changes on disk. Keys are the
+    normalized output names (what normalize_filename makes of the filename
+    cell), so a gallery file name looks up its row as is.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sheets ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " path TEXT NOT NULL,"
+            " filename_column TEXT NOT NULL,"
+            " description_column TEXT NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " UNIQUE (path, filename_column, description_column))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            " sheet_id INTEGER NOT NULL,"
+            " filename TEXT NOT NULL,"
+            " description TEXT,"
+            " PRIMARY KEY (sheet_id, filename))"
+        )
+        self._conn.commit()
+
+    def _sheet_id(self, sheet_path, filename_column, description_column):
+        """Id of the sheet's up-to-date index, (re)building it if the file changed"""
+        path = os.path.abspath(sheet_path)
+        stat = os.stat(path)
+        row = self._conn.execute(
+            "SELECT id, mtime_ns, size FROM sheets "
+            "WHERE path = ? AND filename_column = ? AND description_column = ?",
+            (path, filename_column, description_column)
+        ).fetchone()
+        if row is not None and row[1:] == (stat.st_mtime_ns, stat.st_size):
+            return row[0]
+
+        logging.info(f"Indexing descriptions in {path}")
+        try:
+            if row is not None:
+                self._conn.execute("DELETE FROM descriptions WHERE sheet_id = ?", (row[0],))
+                self._conn.execute("DELETE FROM sheets WHERE id = ?", (row[0],))
+            sheet_id = self._conn.execute(
+                "INSERT INTO sheets (path, filename_column, description_column, mtime_ns, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, filename_column, description_column, stat.st_mtime_ns, stat.st_size)
+            ).lastrowid
+            # The first row for a file name wins, as in a batch run
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO descriptions (sheet_id, filename, description) VALUES (?, ?, ?)",
+                ((sheet_id, normalize_filename(name), description)
+                 for name, description in iter_rows(path, filename_column, description_column))
+            )
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        return sheet_id
+
+    def lookup(self, sheet_path, filename_column, description_column, filename):
+        """Description for an output file name (with or without .jpg), or None"""
+        with self._lock:
+            sheet_id = self._sheet_id(sheet_path, filename_column, description_column)
+            row = self._conn.execute(
+                "SELECT description FROM descriptions WHERE sheet_id = ? AND filename = ?",
+                (sheet_id, normalize_filename(filename))
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def descriptions(self, sheet_path, filename_column, description_column):
+        """Every output file name in the sheet mapped to its description"""
+        with self._lock:
+            sheet_id = self._sheet_id(sheet_path, filename_column, description_column)
+            return dict(self._conn.execute(
+                "SELECT filename, description FROM descriptions WHERE sheet_id = ?", (sheet_id,)
+            ))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_description_index():
+    """Return the process-wide description index under the cache directory"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                cfg = config.load_config()
+                _index = DescriptionIndex(os.path.join(cfg["cache_directory"], "descriptions.sqlite3"))
+    return _index
@@ -0,0 +1,221 @@
+"""Content-addressed, size-bounded on-disk cache of downloaded image bytes"""
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import logging
+import threading
+from atomic_files import write_atomic
+
+
+class CachedDownload:
+    """A cache entry: the stored bytes plus the validators the server sent"""
+
+    def __init__(self, data, etag, last_modified, fresh):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def validators(self):
+        """Headers for a conditional request that revalidates this entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class DownloadCache:
+    """Raw downloaded bytes keyed by the SHA-256 of the URL.
+
+    Bodies live in two-level fan-out directories and a SQLite index tracks
+    size, ETag/Last-Modified and last access. Once the total size passes
+    max_bytes, the least recently used entries are evicted. Entries older
+    than revalidate_seconds are served only after a conditional request
+    (If-None-Match / If-Modified-Since) comes back 304.
+
+    Each put is committed at once, so an index row never lags behind its
+    body file. Access-time updates are committed every COMMIT_EVERY writes
+    and by flush(); losing the last few only makes eviction slightly less
+    accurate.
+    """
+
+    # Trim to this fraction of max_bytes so eviction does not run on every put
+    EVICT_TARGET = 0.9
+    COMMIT_EVERY = 50
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, revalidate_seconds=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_downloads_last_access ON downloads(last_access)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM downloads").fetchone()[0]
+
+    @staticmethod
+    def make_key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _maybe_commit(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self.COMMIT_EVERY:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def get(self, url):
+        """Return a CachedDownload, or None if the URL is not cached"""
+        key = self.make_key(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched FROM downloads WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            # Evicted or deleted underneath us; treat as a miss
+            with self._lock:
+                self._forget(key)
+            return None
+        fresh = self.revalidate_seconds <= 0 or time.time() - row[2] < self.revalidate_seconds
+        return CachedDownload(data, row[0], row[1], fresh)
+
+    def touch(self, url, revalidated=False):
+        """Mark an entry as just used (and, after a 304, as just fetched)"""
+        key = self.make_key(url)
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self._conn.execute(
+                    "UPDATE downloads SET last_access = ?, fetched = ? WHERE key = ?", (now, now, key)
+                )
+            else:
+                self._conn.execute("UPDATE downloads SET last_access = ? WHERE key = ?", (now, key))
+            self._maybe_commit()
+
+    def put(self, url, data, etag=None, last_modified=None):
+        """Store downloaded bytes and their validators"""
+        key = self.make_key(url)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM downloads WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._total_bytes -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (key, url, size, etag, last_modified, fetched, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, len(data), etag, last_modified, now, now)
+            )
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def _forget(self, key):
+        row = self._conn.execute("SELECT size FROM downloads WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._total_bytes -= row[0]
+            self._conn.execute("DELETE FROM downloads WHERE key = ?", (key,))
+            self._maybe_commit()
+
+    def _evict(self):
+        target = self.max_bytes * self.EVICT_TARGET
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM downloads ORDER BY last_access"
+        ).fetchall():
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._conn.execute("DELETE FROM downloads WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        self._conn.commit()
+        logging.info(f"Evicted {evicted} entries from download cache")
+
+    def record(self, hit=False, revalidated=False):
+        with self._lock:
+            if revalidated:
+                self.revalidated += 1
+            if hit or revalidated:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
+
+    def flush(self):
+        """Commit access times still waiting for the next batch"""
+        with self._lock:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_download_cache(cfg):
+    """Return the process-wide download cache, or None if it is disabled"""
+    global _cache
+    if not cfg.get("download_cache_enabled", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = DownloadCache(
+                        os.path.join(cfg["cache_directory"], "downloads"),
+                        max_bytes=int(float(cfg["download_cache_max_mb"]) * 1024 * 1024),
+                        revalidate_seconds=float(cfg["download_cache_revalidate_hours"]) * 3600
+                    )
+                except Exception as e:
+                    logging.error(f"Error opening download cache, downloading without it: {str(e)}")
+                    return None
+                # The cache outlives runs in the app, so it is closed with the process
+                atexit.register(_cache.close)
+    return _cache
@@ -0,0 +1,775 @@
+"""Headless batch engine: search -> download -> resize -> save, with no GUI imports"""
+import os
+import sys
+import argparse
+import itertools
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import closing
+from io import BytesIO
+import config
+from lazy_loader import LazyLoader
+from image_search import get_searcher
+from query_sharing import QueryCoalescer
+from fetchers import create_fetcher
+from candidates import CandidateFilter
+from download_cache import get_download_cache
+from imaging import Transcoder, dhash_image
+from image_index import ImageHashIndex
+from thumbnail_store import ThumbnailStore, THUMBNAIL_DIRNAME
+from row_source import iter_rows, count_rows
+import journal
+from progress import ProgressStats
+from atomic_files import AtomicWriter, write_atomic, remove_stale_temp_files
+from metrics import RunMetrics, MetricsServer
+from log_setup import hot_log, row_log
+
+
+def normalize_filename(filename):
+    """Ensure filename ends with .jpg and strip invalid characters"""
+    filename = str(filename)
+    if not filename.lower().endswith('.jpg'):
+        filename = f"{filename}.jpg"
+    return "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.'))
+
+
+# Names for build_variations' entries, in the same order, for the metrics
+VARIATION_NAMES = ("description", "first_words", "product_prefix", "package_suffix")
+
+
+def build_variations(description):
+    """Create variations of the search query, most specific first"""
+    return [
+        description,
+        " ".join(description.split()[:4]),
+        f"product {description}",
+        f"{description} package"
+    ]
+
+
+def search_images(query, max_results=5, should_continue=None):
+    """Search for images using DuckDuckGo, going through the shared result cache and rate limiter"""
+    return get_searcher().search(query, max_results, should_continue)
+
+
+def write_image(encoded, output_path, writer=None):
+    """Write already-encoded JPEG bytes to output_path.
+
+    The bytes go to a temp file that is renamed over output_path, so a crash
+    or Stop never leaves a truncated image for skip_existing to trust.
+    """
+    hot_log.debug("Saving image to: %s", output_path)
+    if writer is not None:
+        writer.write(output_path, encoded)
+    else:
+        write_atomic(output_path, encoded)
+
+
+class BatchEngine:
+    """Runs a whole Excel sheet through the download pipeline.
+
+    The engine only knows about plain values, so both the GUI and the
+    command line can drive it. Progress is reported through on_progress,
+    which is called with (filename, status) after every row. Settings that
+    have no argument of their own (download backend, timeouts, ...) are read
+    from settings, which defaults to the saved preferences.
+
+    Every row's outcome is written to a JobJournal in the output directory.
+    If the previous run over the same sheet was interrupted, rows it already
+    settled are skipped. With retry_failed, only the journal's failed rows
+    are processed and the sheet is not read at all.
+
+    Stage latencies, bytes downloaded and variation hit rates are collected
+    in metrics while the run goes, written to metrics_directory as JSON when
+    it ends, and served as Prometheus text when metrics_port is set.
+    """
+
+    def __init__(self, excel_path, output_dir, filename_column, description_column,
+                 max_size=800, concurrent_limit=3, skip_existing=True, on_progress=None,
+                 settings=None, retry_failed=False):
+        self.excel_path = excel_path
+        self.output_dir = output_dir
+        self.filename_column = filename_column
+        self.description_column = description_column
+        self.max_size = max_size
+        self.concurrent_limit = concurrent_limit
+        self.skip_existing = skip_existing
+        self.on_progress = on_progress
+        self.retry_failed = retry_failed
+        self.settings = settings if settings is not None else config.load_config()
+        self.prefetch = max(1, int(self.settings["async_prefetch"]))
+        self.hedge_candidates = max(1, int(self.settings["hedge_candidates"]))
+        self.fetcher = None
+        self.transcoder = None
+        self.hedge_executor = None
+        self.queries = None
+        self.image_index = None
+        self.writer = None
+        self.thumbnails = ThumbnailStore(output_dir) if self.settings["thumbnail_cache_enabled"] else None
+        self.screen = CandidateFilter.from_config(self.settings) if self.settings["candidate_prefilter"] else None
+        self.journal = None
+        self.resumed = set()
+        self.resumed_run = None
+        self.is_running = False
+        self.progress = ProgressStats()
+        self.metrics = RunMetrics(progress=self.progress, variation_names=VARIATION_NAMES)
+        self.metrics_server = None
+        self.metrics_path = None
+        self.search_cache_hits = 0
+        self.search_cache_misses = 0
+        self.search_requests = 0
+        self.search_backoff_events = 0
+        self.search_rate = 0.0
+        self.elapsed_seconds = 0.0
+        self.download_cache_hits = 0
+        self.download_cache_misses = 0
+        self.searches_saved = 0
+        self.duplicates_skipped = 0
+        self.candidates_rejected = 0
+
+    @property
+    def total_downloads(self):
+        return self.progress.snapshot().total
+
+    @total_downloads.setter
+    def total_downloads(self, total):
+        self.progress.set_total(total)
+
+    @property
+    def completed_downloads(self):
+        return self.progress.snapshot().completed
+
+    @property
+    def successful_downloads(self):
+        return self.progress.snapshot().succeeded
+
+    @property
+    def skipped_downloads(self):
+        return self.progress.snapshot().skipped
+
+    @property
+    def failed_downloads(self):
+        return self.progress.snapshot().failed
+
+    def stop(self):
+        """Ask the workers to stop after their current request"""
+        self.is_running = False
+
+    def running(self):
+        return self.is_running
+
+    def _report(self, filename, status):
+        if self.on_progress:
+            try:
+                self.on_progress(filename, status)
+            except Exception as e:
+                logging.error(f"Error reporting progress: {str(e)}")
+
+    def log_summary(self):
+        """Write the end-of-run summary to the log"""
+        logging.info(
+            f"Run summary - Success: {self.successful_downloads}, Skipped: {self.skipped_downloads}, "
+            f"Failed: {self.failed_downloads}, Total: {self.completed_downloads}/{self.total_downloads}"
+        )
+        logging.info(f"Search cache - Hits: {self.search_cache_hits}, Misses: {self.search_cache_misses}")
+        if self.queries is not None:
+            stats = self.queries.stats()
+            logging.info(
+                f"Query sharing - Searches: {stats['searches']}, Joined in flight: {stats['joined']}, "
+                f"Reused: {stats['reused']}, Saved: {self.searches_saved}"
+            )
+        logging.info(
+            f"Search rate - Requests: {self.search_requests}, RPS: {self.search_rps():.2f}, "
+            f"Backoff events: {self.search_backoff_events}, Final rate limit: {self.search_rate:.2f}/s"
+        )
+        logging.info(
+            f"Candidates - Rejected before full download: {self.candidates_rejected}, "
+            f"Duplicates skipped: {self.duplicates_skipped}"
+        )
+        logging.info(
+            f"Download cache - Hits: {self.download_cache_hits}, Misses: {self.download_cache_misses}, "
+            f"Hit ratio: {self.download_cache_hit_ratio():.1%}"
+        )
+        stages = self.metrics.snapshot()["stages"]
+        logging.info("Stage latency p50/p95/p99 - " + ", ".join(
+            f"{name}: {s['p50']:.3f}/{s['p95']:.3f}/{s['p99']:.3f}s"
+            for name, s in stages.items() if s["count"]
+        ))
+
+    def write_metrics(self):
+        """Write the run's metrics as JSON under metrics_directory; returns the path or None"""
+        directory = self.settings["metrics_directory"]
+        if not directory:
+            return None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"run_metrics_{time.strftime('%Y%m%d_%H%M%S')}.json")
+            self.metrics.write_json(path, extra={
+                "excel_path": self.excel_path,
+                "output_dir": self.output_dir,
+                "search_cache": {"hits": self.search_cache_hits, "misses": self.search_cache_misses},
+                "search_requests": self.search_requests,
+                "search_backoff_events": self.search_backoff_events,
+                "searches_saved": self.searches_saved,
+                "candidates_rejected": self.candidates_rejected,
+                "duplicates_skipped": self.duplicates_skipped,
+                "download_cache": {"hits": self.download_cache_hits, "misses": self.download_cache_misses}
+            })
+            logging.info(f"Run metrics written to {path}")
+            self.metrics_path = path
+            return path
+        except Exception as e:
+            logging.error(f"Error writing run metrics: {str(e)}")
+            return None
+
+    def search_rps(self):
+        return self.search_requests / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def download_cache_hit_ratio(self):
+        lookups = self.download_cache_hits + self.download_cache_misses
+        return self.download_cache_hits / lookups if lookups else 0.0
+
+    def search(self, query, should_continue=None):
+        """Search through the run's query coalescer, so repeated queries are searched once"""
+        with self.metrics.timer("search"):
+            if self.queries is not None:
+                return self.queries.search(query, should_continue)
+            return search_images(query, should_continue=should_continue)
+
+    def candidate_urls(self, results):
+        """Image URLs from search results, in the order to try them"""
+        if self.screen is not None:
+            return self.screen.rank(results, self.max_size)
+        return [result["image"] for result in results if result.get("image")]
+
+    def prepare_row(self, row):
+        """Return (filename, description, output_path) for a (filename, description) row"""
+        filename = normalize_filename(row[0])
+        description = str(row[1])
+        return filename, description, os.path.join(self.output_dir, filename)
+
+    def settle_early(self, filename, description, output_path):
+        """Finish rows that need no work; returns True if the row was settled here"""
+        if filename in self.resumed:
+            # Settled by the interrupted run we are resuming; keep its journal entry
+            self.finish_item(filename, "skipped", record=False)
+            return True
+        # Skip if file exists and skip option is enabled
+        if self.skip_existing and os.path.exists(output_path):
+            hot_log.info("Skipping existing file: %s", filename)
+            self.finish_item(filename, "skipped", description=description)
+            return True
+        if self.journal is not None:
+            self.journal.mark(filename, journal.PENDING, description=description)
+        return False
+
+    def finish_item(self, filename, status, description=None, url=None, variation=None, record=True,
+                    elapsed=None):
+        """Count a finished row; status is 'succeeded', 'skipped' or 'failed'.
+
+        elapsed is the row's processing time in seconds, for rows that were searched.
+        """
+        if record and filename is not None and self.journal is not None:
+            try:
+                self.journal.mark(filename, status, description=description, url=url, variation=variation)
+            except Exception as e:
+                logging.error(f"Error writing job journal: {str(e)}")
+        if elapsed is not None:
+            self.metrics.observe("row", elapsed)
+        row_log.info("Row %s %s", filename, status, extra={"row": {
+            "filename": filename,
+            "status": status,
+            "description": description,
+            "url": url,
+            "variation": variation,
+            "seconds": round(elapsed, 3) if elapsed is not None else None
+        }})
+        self.progress.record(status)
+        self._report(filename, status)
+
+    def store_image(self, transcoded, output_path):
+        """Write a TranscodeResult's JPEG, unless it duplicates another product's image.
+
+        Returns False when the candidate was skipped as a duplicate, so the
+        caller moves on to the next result. The dHash and thumbnail come
+        from the transcoder's worker, so in staged mode this pool callback
+        only does lookups and file writes.
+        """
+        encoded = transcoded.encoded
+        name = os.path.basename(output_path)
+        claimed = False
+        if self.image_index is not None:
+            try:
+                value = transcoded.dhash
+                if value is None:
+                    value = dhash_image(BytesIO(encoded))
+                duplicate = self.image_index.claim(name, value)
+            except Exception as e:
+                logging.error(f"Error hashing image for {name}: {str(e)}")
+            else:
+                if duplicate is not None:
+                    hot_log.info("Skipping candidate for %s: same image as %s", name, duplicate)
+                    return False
+                claimed = True
+        try:
+            with self.metrics.timer("write"):
+                write_image(encoded, output_path, self.writer)
+        except Exception:
+            if claimed:
+                self.image_index.release(name)
+            raise
+        if claimed:
+            self.image_index.commit(name, output_path)
+        if self.thumbnails is not None and transcoded.thumbnail is not None:
+            # The gallery reads this instead of decoding the full image again
+            try:
+                self.thumbnails.put_bytes(output_path, transcoded.thumbnail)
+            except Exception as e:
+                logging.error(f"Error storing thumbnail for {name}: {str(e)}")
+        return True
+
+    def save_image(self, data, output_path):
+        """Convert downloaded bytes to RGB, shrink them to max_size and save as JPEG"""
+        try:
+            return self.store_image(self.transcoder.transcode(data, self.max_size), output_path)
+        except Exception as e:
+            logging.error(f"Error saving image to {output_path}: {str(e)}")
+            return False
+
+    def _find_image_serial(self, description, output_path):
+        """Try each variation in turn, and its candidates one by one; returns (url, variation) or None"""
+        for index, variation in enumerate(build_variations(description)):
+            if not self.is_running:
+                return None
+
+            try:
+                hot_log.info("Trying search variation: %s", variation)
+                self.metrics.variation_tried(index)
+                results = self.search(variation, should_continue=self.running)
+
+                urls = self.candidate_urls(results)
+                with closing(self.fetcher.fetch_many(urls, self.prefetch)) as downloads:
+                    for image_url, data in downloads:
+                        if not self.is_running:
+                            return None
+
+                        try:
+                            hot_log.info("Trying image downloaded from: %s", image_url)
+
+                            if data and self.save_image(data, output_path):
+                                self.metrics.variation_won(index)
+                                return image_url, variation
+                        except Exception as e:
+                            logging.error(f"Error processing image result: {str(e)}")
+                            continue
+
+            except Exception as e:
+                logging.error(f"Error searching with variation '{variation}': {str(e)}")
+                continue
+        return None
+
+    def _find_image_hedged(self, description, output_path):
+        """Search every variation at once and race downloads of the best candidates.
+
+        At most hedge_candidates downloads run for a row at a time, taken from
+        the most specific variation whose search has returned. Only downloads
+        race: the first body to arrive is transcoded here, in the row's
+        thread, and if it doesn't decode (or duplicates another product's
+        image) the next arrival is tried while a new download takes the freed
+        slot. Once an image is saved, losing downloads stop at their next
+        chunk and queued ones never start.
+        """
+        concurrent = LazyLoader.concurrent_futures()
+        settled = threading.Event()
+
+        def should_continue():
+            return self.is_running and not settled.is_set()
+
+        variations = build_variations(description)
+        searches = {
+            self.hedge_executor.submit(self.search, variation, should_continue): index
+            for index, variation in enumerate(variations)
+        }
+        for index in range(len(variations)):
+            self.metrics.variation_tried(index)
+        candidates = [deque() for _ in variations]
+        downloads = {}
+        tried = set()
+
+        def next_candidate():
+            for index, queue in enumerate(candidates):
+                while queue:
+                    url = queue.popleft()
+                    if url not in tried:
+                        tried.add(url)
+                        return url, index
+            return None
+
+        def launch():
+            while len(downloads) < self.hedge_candidates:
+                candidate = next_candidate()
+                if candidate is None:
+                    return
+                future = self.hedge_executor.submit(self.fetcher.fetch, candidate[0], should_continue)
+                downloads[future] = candidate
+
+        try:
+            while (searches or downloads) and self.is_running:
+                done, _ = concurrent.wait(
+                    list(searches) + list(downloads), timeout=0.2, return_when=concurrent.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future in searches:
+                        index = searches.pop(future)
+                        try:
+                            candidates[index].extend(self.candidate_urls(future.result()))
+                        except Exception as e:
+                            logging.error(f"Error searching with variation '{variations[index]}': {str(e)}")
+                        continue
+
+                    url, index = downloads.pop(future)
+                    try:
+                        data = future.result()
+                        if data and self.is_running and self.save_image(data, output_path):
+                            hot_log.info("Hedged search won with variation '%s': %s", variations[index], url)
+                            self.metrics.variation_won(index)
+                            return url, variations[index]
+                    except Exception as e:
+                        logging.error(f"Error downloading image from {url}: {str(e)}")
+                launch()
+            return None
+        finally:
+            # Losing searches and downloads notice settled and bail out; queued ones never start
+            settled.set()
+            for future in itertools.chain(searches, downloads):
+                future.cancel()
+
+    def process_item(self, row):
+        """Process a single item from the Excel file"""
+        filename = None
+        started = time.perf_counter()
+        try:
+            filename, description, output_path = self.prepare_row(row)
+
+            hot_log.info("Processing file: %s, Description: %s", filename, description)
+
+            if self.settle_early(filename, description, output_path):
+                return
+
+            hot_log.info("Searching with variations for: %s", description)
+            if self.hedge_executor is not None:
+                found = self._find_image_hedged(description, output_path)
+            else:
+                found = self._find_image_serial(description, output_path)
+            if found is None and not self.is_running:
+                return
+
+            chosen_url, chosen_variation = found or (None, None)
+            if found is None:
+                hot_log.warning("No images found for filename %s after trying variations", filename)
+            self.finish_item(
+                filename, "succeeded" if found else "failed",
+                description=description, url=chosen_url, variation=chosen_variation,
+                elapsed=time.perf_counter() - started
+            )
+
+        except Exception as e:
+            logging.error(f"Error processing item: {str(e)}")
+            logging.error(traceback.format_exc())
+            self.finish_item(filename, "failed")
+
+    def _run_threaded(self, rows):
+        """One worker thread per row does search, download and encode in turn.
+
+        Only a window of concurrent_limit * submission_window_factor rows is
+        submitted at a time, and new rows are read as earlier ones finish, so
+        memory stays flat however long the sheet is. On stop, rows that have
+        not started yet are cancelled instead of being drained one by one.
+        """
+        concurrent = LazyLoader.concurrent_futures()
+        window = max(1, self.concurrent_limit * int(self.settings["submission_window_factor"]))
+        in_flight = set()
+
+        def collect(done):
+            for future in done:
+                if future.cancelled():
+                    continue
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Error in future: {str(e)}")
+                    logging.error(traceback.format_exc())
+
+        def wait_for_room(limit):
+            nonlocal in_flight
+            while len(in_flight) > limit:
+                if not self.is_running:
+                    for future in in_flight:
+                        future.cancel()
+                    limit = 0
+                done, in_flight = concurrent.wait(
+                    in_flight, timeout=0.2, return_when=concurrent.FIRST_COMPLETED
+                )
+                collect(done)
+
+        with concurrent.ThreadPoolExecutor(max_workers=self.concurrent_limit) as executor:
+            try:
+                for row in rows:
+                    if not self.is_running:
+                        break
+                    in_flight.add(executor.submit(self.process_item, row))
+                    wait_for_room(window - 1)
+
+                # Wait for the remaining rows to complete
+                wait_for_room(0)
+            except BaseException:
+                # Let queued workers return early instead of blocking shutdown
+                self.stop()
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+    def _journal_source(self):
+        if self.retry_failed:
+            return "retry-failed"
+        return os.path.abspath(self.excel_path)
+
+    def _load_rows(self):
+        """Return the rows to process and set total_downloads"""
+        if self.retry_failed:
+            if self.journal is None:
+                raise RuntimeError("Retrying failed rows requires the job journal (journal_enabled)")
+            failed = self.journal.failed_rows()
+            self.total_downloads = len(failed)
+            logging.info(f"Retrying {self.total_downloads} failed rows from the job journal")
+            return failed
+
+        logging.info(f"Reading Excel file: {self.excel_path}")
+        rows = iter_rows(self.excel_path, self.filename_column, self.description_column)
+        # Parse the header now so a missing column fails before any work starts
+        first = next(rows, None)
+        self.total_downloads = count_rows(self.excel_path) or 0
+
+        self.resumed = set()
+        self.resumed_run = None
+        if self.journal is not None and self.settings["resume_interrupted_runs"]:
+            self.resumed_run = self.journal.interrupted_run(self._journal_source())
+        if self.resumed_run is not None:
+            # Only what the interrupted run settled; older runs' rows may have been meant to redo
+            self.resumed = self.journal.settled_by_run(self.resumed_run)
+            logging.info(f"Resuming interrupted run, {len(self.resumed)} rows already settled")
+        if first is None:
+            return iter(())
+        return itertools.chain([first], rows)
+
+    def _count_rows_in_background(self):
+        total = count_rows(self.excel_path, scan=True)
+        if total and self.is_running:
+            self.progress.set_total(total)
+            logging.info(f"Total items to process: {total}")
+
+    def run(self):
+        """Process every row of the sheet; returns once all workers are done"""
+        self.is_running = True
+        download_cache = None
+        try:
+            logging.info("Starting download process")
+            os.makedirs(self.output_dir, exist_ok=True)
+            removed = remove_stale_temp_files(self.output_dir, subdirectories=(THUMBNAIL_DIRNAME,))
+            if removed:
+                logging.info(f"Removed {removed} partial image files left by an interrupted run")
+            self.writer = AtomicWriter.from_config(self.settings)
+
+            if self.settings["journal_enabled"]:
+                self.journal = journal.JobJournal(self.output_dir)
+            rows = self._load_rows()
+            if self.settings["skip_duplicate_images"]:
+                try:
+                    self.image_index = ImageHashIndex(
+                        self.output_dir, max_distance=int(self.settings["duplicate_max_distance"])
+                    )
+                except Exception as e:
+                    logging.error(f"Error opening image hash index, not checking duplicates: {str(e)}")
+            self.progress.reset(self.total_downloads)
+            logging.info(f"Total items to process: {self.total_downloads or 'unknown'}")
+            if not self.total_downloads and not self.retry_failed:
+                # Counting may mean reading the whole sheet; rows start meanwhile
+                threading.Thread(target=self._count_rows_in_background, daemon=True).start()
+            started = time.monotonic()
+            cache_before = get_searcher().stats()
+            download_cache = get_download_cache(self.settings)
+            downloads_before = download_cache.stats() if download_cache else None
+            self._report(None, "started")
+
+            if self.settings["query_sharing_enabled"]:
+                self.queries = QueryCoalescer(
+                    get_searcher().lookup,
+                    max_entries=int(self.settings["query_sharing_max_entries"])
+                )
+            self.fetcher = create_fetcher(self.settings, screen=self.screen)
+            self.fetcher.metrics = self.metrics
+            # Before any worker thread exists, so no job waits on pool start-up
+            self.transcoder = Transcoder(
+                workers=int(self.settings["encode_workers"]),
+                use_processes=self.settings["process_pool_transcoding"],
+                metrics=self.metrics,
+                timeout=float(self.settings["transcode_timeout"]),
+                thumbnail_size=self.thumbnails.size if self.thumbnails is not None else None,
+                thumbnail_quality=ThumbnailStore.QUALITY,
+                with_hash=self.image_index is not None
+            ).start()
+            if int(self.settings["metrics_port"]) > 0:
+                try:
+                    self.metrics_server = MetricsServer(self.metrics, int(self.settings["metrics_port"]))
+                except Exception as e:
+                    logging.error(f"Error starting metrics server: {str(e)}")
+            if self.journal is not None:
+                self.journal.start_run(self._journal_source(), resumed_from=self.resumed_run)
+            if self.settings.get("pipeline_mode") == "staged":
+                from pipeline import StagedPipeline
+                StagedPipeline(self).run(rows)
+            else:
+                if self.settings["hedged_search"]:
+                    self.hedge_executor = LazyLoader.concurrent_futures().ThreadPoolExecutor(
+                        max_workers=max(1, int(self.settings["hedge_workers"])),
+                        thread_name_prefix="hedge"
+                    )
+                self._run_threaded(rows)
+
+            cache_after = get_searcher().stats()
+            self.search_cache_hits = cache_after["hits"] - cache_before["hits"]
+            self.search_cache_misses = cache_after["misses"] - cache_before["misses"]
+            self.search_requests = cache_after["requests"] - cache_before["requests"]
+            self.search_backoff_events = cache_after["backoff_events"] - cache_before["backoff_events"]
+            self.search_rate = cache_after["rate"]
+            self.elapsed_seconds = time.monotonic() - started
+            if download_cache is not None:
+                downloads_after = download_cache.stats()
+                self.download_cache_hits = downloads_after["hits"] - downloads_before["hits"]
+                self.download_cache_misses = downloads_after["misses"] - downloads_before["misses"]
+            if self.queries is not None:
+                self.searches_saved = self.queries.saved()
+            if self.image_index is not None:
+                self.duplicates_skipped = self.image_index.duplicates
+            if self.screen is not None:
+                self.candidates_rejected = self.screen.rejected
+            if self.is_running:
+                self.total_downloads = self.completed_downloads
+                if self.journal is not None:
+                    self.journal.finish_run()
+            logging.info("Download process completed")
+            self.log_summary()
+            self.write_metrics()
+        finally:
+            self.is_running = False
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+                self.metrics_server = None
+            if self.journal is not None:
+                self.journal.close()
+            if self.image_index is not None:
+                self.image_index.close()
+            if self.hedge_executor is not None:
+                # Losing downloads end on their own; nothing needs their results
+                self.hedge_executor.shutdown(wait=False, cancel_futures=True)
+                self.hedge_executor = None
+            if self.fetcher is not None:
+                self.fetcher.close()
+            if self.transcoder is not None:
+                self.transcoder.close()
+            if self.writer is not None:
+                self.writer.close()
+            if download_cache is not None:
+                download_cache.flush()
+
+
+def main(argv=None):
+    """Entry point for `fetch_images.py batch`"""
+    prefs = config.load_config()
+    parser = argparse.ArgumentParser(
+        prog="fetch_images.py batch",
+        description="Download images for every row of an Excel file without the GUI"
+    )
+    parser.add_argument("excel_path", nargs="?", help="Excel file with filenames and descriptions")
+    parser.add_argument("--filename-column", default=prefs["filename_column"])
+    parser.add_argument("--description-column", default=prefs["description_column"])
+    parser.add_argument("--max-size", type=int, default=int(prefs["max_size"]))
+    parser.add_argument("--concurrency", type=int, default=int(prefs["concurrent_downloads"]))
+    parser.add_argument("--output-dir", default=prefs["download_directory"])
+    parser.add_argument("--no-skip-existing", dest="skip_existing", action="store_false",
+                        default=prefs["skip_existing"], help="Download again even if the file exists")
+    parser.add_argument("--backend", choices=["threads", "asyncio"], default=prefs["download_backend"],
+                        help="Download backend (asyncio requires aiohttp)")
+    parser.add_argument("--pipeline", choices=["threads", "staged"], default=prefs["pipeline_mode"],
+                        help="Run each row in one thread, or split search/fetch/encode into stages")
+    parser.add_argument("--hedged", dest="hedged_search", action="store_true",
+                        default=prefs["hedged_search"],
+                        help="Search all variations at once and keep the first candidate that decodes")
+    parser.add_argument("--metrics-port", type=int, default=int(prefs["metrics_port"]),
+                        help="Serve live metrics as Prometheus text on this local port (0 = off)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only retry rows that failed in earlier runs (from the job journal)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        default=prefs["resume_interrupted_runs"],
+                        help="Start from the first row even if the previous run was interrupted")
+    args = parser.parse_args(argv)
+    if not args.excel_path and not args.retry_failed:
+        parser.error("excel_path is required unless --retry-failed is given")
+    prefs["resume_interrupted_runs"] = args.resume
+    prefs["download_backend"] = args.backend
+    prefs["pipeline_mode"] = args.pipeline
+    prefs["hedged_search"] = args.hedged_search
+    prefs["metrics_port"] = args.metrics_port
+
+    print_lock = threading.Lock()
+
+    def print_progress(filename, status):
+        # Workers report concurrently; print whole lines only
+        with print_lock:
+            if filename is None:
+                print(f"Processing {engine.total_downloads or 'an unknown number of'} items from {args.excel_path or 'the job journal'}", flush=True)
+                return
+            progress = engine.progress.snapshot()
+            print(f"[{progress.completed}/{progress.total or '?'}] {status}: {filename}", flush=True)
+
+    engine = BatchEngine(
+        excel_path=args.excel_path,
+        output_dir=args.output_dir,
+        filename_column=args.filename_column,
+        description_column=args.description_column,
+        max_size=args.max_size,
+        concurrent_limit=args.concurrency,
+        skip_existing=args.skip_existing,
+        on_progress=print_progress,
+        settings=prefs,
+        retry_failed=args.retry_failed
+    )
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        engine.stop()
+        print("Stopped by user", flush=True)
+        return 130
+    except Exception as e:
+        logging.error(f"Error in batch run: {str(e)}")
+        logging.error(traceback.format_exc())
+        print(f"Error: {str(e)}", file=sys.stderr, flush=True)
+        return 1
+
+    print(f"Completed: {engine.successful_downloads} | "
+          f"Skipped: {engine.skipped_downloads} | "
+          f"Failed: {engine.failed_downloads}", flush=True)
+    print(f"Search cache: {engine.search_cache_hits} hits | {engine.search_cache_misses} misses", flush=True)
+    print(f"Searches: {engine.search_requests} ({engine.search_rps():.2f}/s) | "
+          f"Saved by query sharing: {engine.searches_saved} | "
+          f"Rate-limit backoffs: {engine.search_backoff_events}", flush=True)
+    print(f"Candidates rejected early: {engine.candidates_rejected} | "
+          f"Duplicates skipped: {engine.duplicates_skipped}", flush=True)
+    print(f"Download cache: {engine.download_cache_hits} hits | {engine.download_cache_misses} misses "
+          f"({engine.download_cache_hit_ratio():.1%})", flush=True)
+    if engine.metrics_path:
+        print(f"Metrics: {engine.metrics_path}", flush=True)
+    return 0 if engine.failed_downloads == 0 else 2
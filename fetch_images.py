@@ -3,59 +3,43 @@ import os
 import sys
 import logging
 import traceback
-from datetime import datetime
-import customtkinter as ctk
-from tkinter import messagebox, filedialog
+# The batch subcommand runs headless, so the GUI toolkit is only imported for the app.
+# Spawned encode processes import this file as __mp_main__ and don't need it either.
+if __name__ != "__mp_main__" and not (__name__ == "__main__" and sys.argv[1:2] == ["batch"]):
+    import customtkinter as ctk
+    from tkinter import messagebox, filedialog
 import threading
 import config
+import engine
+from lazy_loader import LazyLoader
+from log_setup import setup_logging
+from imaging import load_image, transcode_image
+from atomic_files import write_atomic
+from description_index import get_description_index
+from fetchers import get_shared_fetcher
+from thumbnail_store import ThumbnailStore, THUMBNAIL_SIZE
 import shutil
 import time
+import queue
+from collections import OrderedDict
 from io import BytesIO
 
-# Lazy imports - only import when needed
-class LazyLoader:
-    _pandas = None
-    _ddgs = None
-    _pillow = None
-    _requests = None
-    _concurrent_futures = None
-    
-    @classmethod
-    def pandas(cls):
-        if cls._pandas is None:
-            import pandas as pd
-            cls._pandas = pd
-        return cls._pandas
-    
-    @classmethod
-    def ddgs(cls):
-        if cls._ddgs is None:
-            from duckduckgo_search import DDGS
-            cls._ddgs = DDGS
-        return cls._ddgs
-    
-    @classmethod
-    def pillow(cls):
-        if cls._pillow is None:
-            from PIL import Image, ImageTk
-            cls._pillow = (Image, ImageTk)
-        return cls._pillow
-    
-    @classmethod
-    def requests(cls):
-        if cls._requests is None:
-            import requests
-            cls._requests = requests
-        return cls._requests
-    
-    @classmethod
-    def concurrent_futures(cls):
-        if cls._concurrent_futures is None:
-            import concurrent.futures
-            cls._concurrent_futures = concurrent.futures
-        return cls._concurrent_futures
-
 class ImageGalleryWindow:
+    """Virtualized image grid: only the rows in view have widgets, recycled as you scroll.
+
+    Thumbnails are read from the persistent thumbnail store (or decoded and
+    added to it) by a background thread and handed to the UI thread through
+    a queue, so opening and scrolling never wait on disk however many
+    images the directory holds.
+    """
+
+    THUMBNAIL_SIZE = THUMBNAIL_SIZE
+    CELL_WIDTH = 290
+    ROW_HEIGHT = 470
+    # Decoded thumbnails kept in memory; a few screens' worth
+    THUMBNAIL_CACHE_SIZE = 240
+    POLL_MS = 50
+
     def __init__(self, parent):
         self.parent = parent
         self.top = ctk.CTkToplevel()
@@ -78,146 +62,256 @@ class ImageGalleryWindow:
         self.canvas = ctk.CTkCanvas(self.main_frame, bg="white", highlightthickness=0)
         self.scrollbar = ctk.CTkScrollbar(self.main_frame, orientation="vertical", command=self.canvas.yview)
         
-        # Create frame inside canvas for images
-        self.scrollable_frame = ctk.CTkFrame(self.canvas, fg_color="white")
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        
-        # Create window inside canvas
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        
-        # Configure canvas to expand with window
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        self.main_frame.grid_rowconfigure(0, weight=1)
-        self.main_frame.grid_columnconfigure(0, weight=1)
-        
-        # Grid layout for canvas and scrollbar
+        # Every scroll, whatever its source, goes through yscrollcommand
+        self.canvas.configure(yscrollcommand=self._on_scroll)
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
         
-        # Bind canvas resizing
-        self.canvas.bind('<Configure>', self._on_canvas_configure)
-        
-        # Initialize image references and data
-        self.image_references = {}
-        self.current_row = 0
+        # Bind canvas resizing, and the mouse wheel anywhere in the window
+        self.canvas.bind('<Configure>', lambda event: self._schedule_update())
+        self.top.bind('<MouseWheel>', self._on_mousewheel)
+        self.top.bind('<Button-4>', lambda event: self.canvas.yview_scroll(-1, "units"))
+        self.top.bind('<Button-5>', lambda event: self.canvas.yview_scroll(1, "units"))
+        self.canvas.configure(yscrollincrement=40)
+        
+        # Image list and recycled widget slots
+        self.entries = []
+        self.paths = {}
+        self.descriptions = {}
         self.images_per_row = 3
-        self.image_frames = {}
+        self.slots = {}
+        self.free_slots = []
+        self.thumbnails = OrderedDict()
+        self.failed_thumbnails = set()
+        self.previews = {}
         self.current_replacements = {}
         self.used_urls = {}
-        
-    def _on_canvas_configure(self, event):
-        # Update the scrollable region when the canvas is resized
-        self.canvas.itemconfig(self.canvas_window, width=event.width)
+        self.thumbnail_store = None
+        if parent.config.get("thumbnail_cache_enabled", True):
+            self.thumbnail_store = ThumbnailStore(parent.download_dir_var.get(), self.THUMBNAIL_SIZE)
+        
+        placeholder = LazyLoader.image().new("RGB", (self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE), "gray80")
+        self.placeholder = ctk.CTkImage(light_image=placeholder, dark_image=placeholder, size=placeholder.size)
+        
+        # Thumbnail loading: the newest request is served first, so what is in view loads first
+        self._wanted = set()
+        self._requested = set()
+        self._thumbnail_requests = queue.LifoQueue()
+        self._thumbnail_results = queue.Queue()
+        self._closed = False
+        self._update_pending = False
+        threading.Thread(target=self._thumbnail_worker, name="gallery-thumbnails", daemon=True).start()
+        self.top.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.top.after(self.POLL_MS, self._drain_thumbnails)
+        
+    def _on_close(self):
+        self._closed = True
+        self.top.destroy()
+        
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_update()
+        
+    def _on_mousewheel(self, event):
+        self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")
         
     def add_image(self, filename, description, image_path):
-        try:
-            # Create frame for this image
-            image_frame = ctk.CTkFrame(self.scrollable_frame, fg_color="gray90")
-            image_frame.grid(row=self.current_row // self.images_per_row,
-                           column=self.current_row % self.images_per_row,
-                           padx=10, pady=10, sticky="nsew")
-            
-            # Load and resize image
-            Image, ImageTk = LazyLoader.pillow()
-            img = Image.open(image_path)
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Resize image
-            img.thumbnail((200, 200))
-            
-            # Convert to CTkImage
-            photo = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
-            
-            # Keep reference to prevent garbage collection
-            self.image_references[filename] = {
-                'photo': photo,
-                'description': description
-            }
-            
-            # Create and pack image label
-            img_label = ctk.CTkLabel(image_frame, image=photo, text="")
-            img_label.pack(padx=5, pady=5)
-            
-            # Create and pack filename label - remove .jpg extension for display
-            display_filename = filename[:-4] if filename.lower().endswith('.jpg') else filename
-            name_label = ctk.CTkLabel(image_frame, text=display_filename, 
-                                    font=("Helvetica", 12, "bold"))
-            name_label.pack(padx=5)
-            
-            # Create and pack description label with larger wraplength and height
-            desc_label = ctk.CTkLabel(image_frame, text=description, 
-                                    wraplength=250,  
-                                    font=("Helvetica", 12),  
-                                    height=120)  
-            desc_label.pack(padx=10, pady=(5, 10), fill="both", expand=True)
-            
-            # Add Replace button
-            replace_button = ctk.CTkButton(
-                image_frame,
-                text="Replace Image",
-                command=lambda f=filename: self.get_replacement(f)
-            )
-            replace_button.pack(pady=5)
-            
-            # Add Approve button (initially disabled)
-            approve_button = ctk.CTkButton(
-                image_frame,
-                text="Approve New",
-                command=lambda f=filename: self.approve_replacement(f),
-                state="disabled"
+        """Append an image; widgets are only created once it scrolls into view"""
+        self.entries.append(filename)
+        self.paths[filename] = image_path
+        self.descriptions[filename] = description
+        self._schedule_update()
+        
+    def set_images(self, images):
+        """Show (filename, description, image_path) entries, replacing the current list"""
+        self.entries = [filename for filename, _, _ in images]
+        self.paths = {filename: path for filename, _, path in images}
+        self.descriptions = {filename: description for filename, description, _ in images}
+        for slot in self.slots.values():
+            self._release_slot(slot)
+        self.slots = {}
+        self._schedule_update()
+        
+    def _schedule_update(self):
+        if not self._update_pending:
+            self._update_pending = True
+            self.top.after_idle(self._update_visible)
+            
+    def _update_visible(self):
+        """Give every row in (or next to) the viewport a slot, and take slots back from the rest"""
+        self._update_pending = False
+        if self._closed:
+            return
+        width = max(self.canvas.winfo_width(), 1)
+        self.images_per_row = max(1, width // self.CELL_WIDTH)
+        rows = -(-len(self.entries) // self.images_per_row)
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * self.ROW_HEIGHT, 1)))
+        self.counter_label.configure(text=f"Total Images: {len(self.entries)}")
+        
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self.ROW_HEIGHT) - 1)
+        last_row = min(rows - 1, int(bottom // self.ROW_HEIGHT) + 1)
+        visible = range(first_row * self.images_per_row,
+                        min(len(self.entries), (last_row + 1) * self.images_per_row))
+        self._wanted = {self.entries[index] for index in visible}
+        
+        for index in list(self.slots):
+            if index not in visible:
+                self._release_slot(self.slots.pop(index))
+                
+        cell_width = width // self.images_per_row
+        for index in visible:
+            slot = self.slots.get(index)
+            if slot is None:
+                slot = self.free_slots.pop() if self.free_slots else self._create_slot()
+                self.slots[index] = slot
+                self._bind_slot(slot, index)
+            row, column = divmod(index, self.images_per_row)
+            self.canvas.coords(slot['window'], column * cell_width + 10, row * self.ROW_HEIGHT + 10)
+            self.canvas.itemconfigure(
+                slot['window'], width=cell_width - 20, height=self.ROW_HEIGHT - 20, state="normal"
             )
-            approve_button.pack(pady=5)
             
-            # Store frame references
-            self.image_frames[filename] = {
-                'frame': image_frame,
-                'image_label': img_label,
-                'desc_label': desc_label,
-                'approve_button': approve_button,
-                'photo': photo
-            }
-            
-            self.current_row += 1
-            
-            # Configure column weights
-            self.scrollable_frame.grid_columnconfigure(self.current_row % self.images_per_row, weight=1)
-            
-            # Update counter label
-            self.counter_label.configure(text=f"Total Images: {self.current_row}")
-            
-        except Exception as e:
-            logging.error(f"Error adding image to gallery: {str(e)}")
-            logging.error(traceback.format_exc())
+    def _create_slot(self):
+        slot = {'filename': None, 'index': None}
+        frame = ctk.CTkFrame(self.canvas, fg_color="gray90")
+        
+        slot['image_label'] = ctk.CTkLabel(frame, image=self.placeholder, text="")
+        slot['image_label'].pack(padx=5, pady=5)
+        
+        slot['name_label'] = ctk.CTkLabel(frame, text="", font=("Helvetica", 12, "bold"))
+        slot['name_label'].pack(padx=5)
+        
+        slot['desc_label'] = ctk.CTkLabel(frame, text="",
+                                          wraplength=250,
+                                          font=("Helvetica", 12),
+                                          height=120)
+        slot['desc_label'].pack(padx=10, pady=(5, 10), fill="both", expand=True)
+        
+        # Buttons act on whatever image the slot shows at the time
+        replace_button = ctk.CTkButton(
+            frame,
+            text="Replace Image",
+            command=lambda: self.get_replacement(slot['filename'])
+        )
+        replace_button.pack(pady=5)
+        
+        slot['approve_button'] = ctk.CTkButton(
+            frame,
+            text="Approve New",
+            command=lambda: self.approve_replacement(slot['filename']),
+            state="disabled"
+        )
+        slot['approve_button'].pack(pady=5)
+        
+        slot['window'] = self.canvas.create_window(0, 0, window=frame, anchor="nw")
+        return slot
+        
+    def _release_slot(self, slot):
+        # Park it off-screen too; some Tk builds ignore state on window items
+        self.canvas.coords(slot['window'], -10000, -10000)
+        self.canvas.itemconfigure(slot['window'], state="hidden")
+        slot['filename'] = slot['index'] = None
+        self.free_slots.append(slot)
+        
+    def _bind_slot(self, slot, index):
+        """Point a recycled slot at the image at index"""
+        filename = self.entries[index]
+        slot['filename'], slot['index'] = filename, index
+        # Remove .jpg extension for display
+        display_filename = filename[:-4] if filename.lower().endswith('.jpg') else filename
+        slot['name_label'].configure(text=display_filename)
+        slot['desc_label'].configure(text=self.descriptions.get(filename, ""))
+        slot['approve_button'].configure(
+            state="normal" if filename in self.current_replacements else "disabled"
+        )
+        self._show_thumbnail(slot)
+        
+    def _show_thumbnail(self, slot):
+        filename = slot['filename']
+        photo = self.previews.get(filename) or self.thumbnails.get(filename)
+        if photo is not None:
+            if filename in self.thumbnails:
+                self.thumbnails.move_to_end(filename)
+            slot['image_label'].configure(image=photo, text="")
+            return
+        text = "Image unavailable" if filename in self.failed_thumbnails else "Loading..."
+        slot['image_label'].configure(image=self.placeholder, text=text)
+        if filename not in self.failed_thumbnails and filename not in self._requested:
+            self._requested.add(filename)
+            self._thumbnail_requests.put((filename, self.paths[filename]))
+            
+    def _slot_for(self, filename):
+        return next((slot for slot in self.slots.values() if slot['filename'] == filename), None)
+        
+    def _refresh(self, filename):
+        slot = self._slot_for(filename)
+        if slot is not None:
+            self._bind_slot(slot, slot['index'])
+            
+    def _thumbnail_worker(self):
+        """Background thread: decode thumbnails; Tk objects are made on the UI thread"""
+        while not self._closed:
+            try:
+                filename, path = self._thumbnail_requests.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if filename not in self._wanted:
+                # Scrolled past before we got to it
+                self._thumbnail_results.put((filename, None, False))
+                continue
+            try:
+                if self.thumbnail_store is not None:
+                    img = self.thumbnail_store.load(path)
+                else:
+                    img = load_image(path, self.THUMBNAIL_SIZE)
+                self._thumbnail_results.put((filename, img, True))
+            except Exception as e:
+                logging.error(f"Error loading thumbnail for {path}: {str(e)}")
+                self._thumbnail_results.put((filename, None, True))
+                
+    def _drain_thumbnails(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                filename, img, loaded = self._thumbnail_results.get_nowait()
+                self._requested.discard(filename)
+                if not loaded:
+                    continue
+                if img is None:
+                    self.failed_thumbnails.add(filename)
+                else:
+                    self.thumbnails[filename] = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+                    while len(self.thumbnails) > self.THUMBNAIL_CACHE_SIZE:
+                        self.thumbnails.popitem(last=False)
+                self._refresh(filename)
+        except queue.Empty:
+            pass
+        self.top.after(self.POLL_MS, self._drain_thumbnails)
             
     def get_replacement(self, filename):
         try:
-            if filename not in self.image_frames:
+            if filename not in self.paths:
                 return
                 
             # Get original description from Excel
-            pd = LazyLoader.pandas()
             if os.path.exists(self.parent.file_path.get()):
-                df = pd.read_excel(self.parent.file_path.get())
                 filename_col = self.parent.filename_column_var.get()
                 desc_col = self.parent.description_column_var.get()
                 
-                # Find the matching row in Excel
-                base_filename = filename[:-4] if filename.lower().endswith('.jpg') else filename
-                matching_row = df[df[filename_col].astype(str) == base_filename]
-                if not matching_row.empty:
-                    description = str(matching_row.iloc[0][desc_col])
+                # Look the row up in the indexed sheet
+                description = get_description_index().lookup(
+                    self.parent.file_path.get(), filename_col, desc_col, filename
+                )
+                if description is not None:
                     logging.info(f"Found description for {filename}: {description}")
                 else:
-                    description = self.image_references[filename]['description']
+                    description = self.descriptions.get(filename, "")
                     logging.warning(f"No Excel description found for {filename}, using stored description")
             else:
-                description = self.image_references[filename]['description']
+                description = self.descriptions.get(filename, "")
                 logging.warning("Excel file not found, using stored description")
             
             # Keep track of previously used URLs for this image
@@ -243,34 +337,24 @@ class ImageGalleryWindow:
                 image_url = result['image']
                 
                 try:
-                    # Download and process image
-                    requests = LazyLoader.requests()
-                    response = requests.get(image_url, timeout=10)
+                    # Download (or read from the download cache) and process image
+                    data = get_shared_fetcher().fetch(image_url)
                     
-                    if response.status_code == 200:
-                        Image, ImageTk = LazyLoader.pillow()
-                        image_data = BytesIO(response.content)
-                        img = Image.open(image_data)
-                        
-                        if img.mode in ('RGBA', 'P'):
-                            img = img.convert('RGB')
-                            
-                        # Resize for preview
-                        img.thumbnail((200, 200))
+                    if data:
+                        # Load at preview size
+                        img = load_image(BytesIO(data), self.THUMBNAIL_SIZE)
                         
                         # Convert to CTkImage
-                        photo = ImageTk.PhotoImage(img)
-                        self.image_frames[filename]['image_label'].configure(image=photo)
-                        self.image_frames[filename]['photo'] = photo
-                        self.image_frames[filename]['approve_button'].configure(state="normal")
+                        self.previews[filename] = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
                         
                         # Store replacement data and mark URL as used
                         self.current_replacements[filename] = {
                             'url': image_url,
-                            'data': response.content,
+                            'data': data,
                             'description': description
                         }
                         self.used_urls[filename].add(image_url)
+                        self._refresh(filename)
                         
                         return
                         
@@ -298,20 +382,20 @@ class ImageGalleryWindow:
             
             target_path = os.path.join(output_dir, target_filename)
             
-            # Save the new image
-            with open(target_path, 'wb') as f:
-                f.write(replacement_data['data'])
+            # Encode like a batch run would, then swap the file in whole
+            max_size = int(self.parent.max_size_var.get())
+            write_atomic(target_path, transcode_image(replacement_data['data'], max_size), fsync=True)
             
             # Update the description
             if 'description' in replacement_data:
-                self.image_references[filename]['description'] = replacement_data['description']
+                self.descriptions[filename] = replacement_data['description']
             
-            # Disable approve button
-            if filename in self.image_frames:
-                self.image_frames[filename]['approve_button'].configure(state="disabled")
-            
-            # Clear replacement data
+            # Clear replacement data; the thumbnail is reloaded from the new file
             del self.current_replacements[filename]
+            self.previews.pop(filename, None)
+            self.thumbnails.pop(filename, None)
+            self.failed_thumbnails.discard(filename)
+            self._refresh(filename)
             
             messagebox.showinfo("Success", "Image replaced successfully")
             
@@ -430,25 +514,16 @@ class SingleImageWindow:
             result = self.current_results[self.current_index]
             image_url = result["image"]
             
-            # Download and show preview
-            requests = LazyLoader.requests()
-            response = requests.get(image_url, timeout=10)
+            # Download (or read from the download cache) and show preview
+            data = get_shared_fetcher().fetch(image_url)
             
-            if response.status_code == 200:
-                Image, ImageTk = LazyLoader.pillow()
-                image_data = BytesIO(response.content)
-                img = Image.open(image_data)
-                
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Resize for preview while maintaining aspect ratio
-                max_size = (400, 400)
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            if data:
+                _, ImageTk = LazyLoader.pillow()
+                # Load at preview size while maintaining aspect ratio
+                img = load_image(BytesIO(data), 400)
                 
                 # Store current image
-                self.current_image = image_data.getvalue()
+                self.current_image = data
                 
                 # Update preview
                 self.photo_reference = ImageTk.PhotoImage(img)
@@ -486,21 +561,9 @@ class SingleImageWindow:
             # Get output path
             output_path = os.path.join(self.parent.download_dir_var.get(), filename)
             
-            # Save image
-            Image, _ = LazyLoader.pillow()
-            img = Image.open(BytesIO(self.current_image))
-            
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-                
-            # Resize if needed
+            # Encode at the configured max size, then swap the file in whole
             max_size = int(self.parent.max_size_var.get())
-            if max(img.size) > max_size:
-                ratio = max_size / max(img.size)
-                new_size = tuple(int(dim * ratio) for dim in img.size)
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                
-            img.save(output_path, "JPEG", quality=85)
+            write_atomic(output_path, transcode_image(self.current_image, max_size), fsync=True)
             self.status_var.set("Image saved successfully!")
             self.top.destroy()
             
@@ -509,6 +572,8 @@ class SingleImageWindow:
             logging.error(f"Error saving image: {str(e)}")
 
 class ImageDownloaderApp:
+    PROGRESS_POLL_MS = 100
+    
     def __init__(self):
         logging.info("Initializing ImageDownloaderApp")
         self.window = ctk.CTk()
@@ -526,12 +591,10 @@ class ImageDownloaderApp:
         self.filename_column_var = ctk.StringVar(value=self.config["filename_column"])
         self.download_dir_var = ctk.StringVar(value=self.config["download_directory"])
         self.file_path = ctk.StringVar()
-        self.completed_downloads = 0
-        self.failed_downloads = 0
-        self.skipped_downloads = 0
-        self.successful_downloads = 0
-        self.total_downloads = 0
+        self.engine = None
         self.is_running = False
+        self.download_thread = None
+        self.last_progress = None
         self.gallery_window = None
         
         # Create main frame with padding
@@ -623,6 +686,9 @@ class ImageDownloaderApp:
         self.start_button = ctk.CTkButton(self.control_frame, text="Start Download", command=self.start_download, width=150)
         self.start_button.pack(side="left", padx=5)
         
+        self.retry_button = ctk.CTkButton(self.control_frame, text="Retry Failed", command=self.retry_failed_downloads, width=120)
+        self.retry_button.pack(side="left", padx=5)
+        
         self.stop_button = ctk.CTkButton(self.control_frame, text="Stop", command=self.stop_download, state="disabled", width=100)
         self.stop_button.pack(side="left", padx=5)
         
@@ -647,6 +713,9 @@ class ImageDownloaderApp:
         self.stats_label = ctk.CTkLabel(self.stats_frame, text="Statistics: ")
         self.stats_label.pack(side="left", padx=5)
         
+        self.metrics_label = ctk.CTkLabel(self.stats_frame, text="")
+        self.metrics_label.pack(side="right", padx=5)
+        
         # Log frame with scrollable text
         self.log_frame = ctk.CTkFrame(self.main_frame)
         self.log_frame.pack(fill="both", expand=True, pady=(0, 10))
@@ -663,7 +732,7 @@ class ImageDownloaderApp:
         logging.info("Browse file dialog opened")
         file_path = filedialog.askopenfilename(
             title="Select Excel File",
-            filetypes=[("Excel files", "*.xlsx;*.xls")]
+            filetypes=[("Excel files", "*.xlsx;*.xls"), ("CSV files", "*.csv"), ("Parquet files", "*.parquet")]
         )
         if file_path:
             logging.info(f"Selected file: {file_path}")
@@ -681,203 +750,70 @@ class ImageDownloaderApp:
             logging.error(f"Error updating log: {str(e)}")
     
     def update_progress(self):
+        """Show the engine's counters; runs on the UI thread only"""
         try:
-            if self.total_downloads > 0:
-                progress = (self.completed_downloads / self.total_downloads) * 100
-                self.progress_bar.set(progress)
-                
-                # Update progress text
-                progress_text = f"Progress: {self.completed_downloads}/{self.total_downloads}"
-                self.status_label.configure(text=progress_text)
-                
-                # Update statistics
-                success_count = self.completed_downloads - self.failed_downloads - self.skipped_downloads
-                stats_text = f"Completed: {success_count} | "
-                stats_text += f"Skipped: {self.skipped_downloads} | "
-                stats_text += f"Failed: {self.failed_downloads}"
-                self.stats_label.configure(text=stats_text)
-                logging.debug(f"Stats - Success: {success_count}, Skipped: {self.skipped_downloads}, Failed: {self.failed_downloads}, Total Progress: {self.completed_downloads}/{self.total_downloads}")
+            run = self.engine
+            if run is None:
+                return
+            progress = run.progress.snapshot()
+            if progress == self.last_progress or (progress.total <= 0 and progress.completed == 0):
+                return
+            self.last_progress = progress
+            # A total of 0 means the source couldn't be counted up front
+            if progress.total > 0:
+                self.progress_bar.set(progress.completed / progress.total)
+            
+            # Update progress text
+            progress_text = f"Progress: {progress.completed}/{progress.total or '?'}"
+            self.status_label.configure(text=progress_text)
+            
+            # Update statistics
+            stats_text = f"Completed: {progress.succeeded} | "
+            stats_text += f"Skipped: {progress.skipped} | "
+            stats_text += f"Failed: {progress.failed}"
+            self.stats_label.configure(text=stats_text)
+            
+            # Live throughput and latency from the run's metrics
+            metrics = run.metrics.snapshot()
+            stages = metrics["stages"]
+            metrics_text = f"{metrics['items_per_second']:.1f} items/s | "
+            metrics_text += f"p95 search {stages['search']['p95']:.2f}s, "
+            metrics_text += f"fetch {stages['fetch']['p95']:.2f}s | "
+            metrics_text += f"{metrics['bytes_downloaded'] / (1024 * 1024):.1f} MB"
+            self.metrics_label.configure(text=metrics_text)
         except Exception as e:
             logging.error(f"Error in update_progress: {str(e)}")
+    
+    def poll_progress(self):
+        """Refresh the progress display every PROGRESS_POLL_MS while a run is active.
 
-    def increment_counter(self, counter_name):
-        def _increment():
-            if counter_name == 'successful':
-                self.successful_downloads += 1
-            elif counter_name == 'skipped':
-                self.skipped_downloads += 1
-            elif counter_name == 'failed':
-                self.failed_downloads += 1
-            self.update_progress()
-        self.window.after(0, _increment)
+        Workers only bump counters; the display cost is fixed at this tick
+        rate however fast rows finish.
+        """
+        self.update_progress()
+        if self.is_running or (self.download_thread is not None and self.download_thread.is_alive()):
+            self.window.after(self.PROGRESS_POLL_MS, self.poll_progress)
 
     def search_images(self, query, max_results=5):
         """Search for images using DuckDuckGo"""
-        try:
-            ddgs = LazyLoader.ddgs()
-            with ddgs() as ddg:
-                results = list(ddg.images(
-                    keywords=query,
-                    max_results=max_results,
-                    safesearch="off"
-                ))
-                logging.info(f"Found {len(results)} images for query: {query}")
-                return results
-        except Exception as e:
-            logging.error(f"Error searching for images: {str(e)}")
-            return []
-    
-    def process_item(self, row, output_dir, max_size):
-        """Process a single item from the Excel file"""
-        try:
-            filename = str(row[self.filename_column_var.get()])
-            description = str(row[self.description_column_var.get()])
-            
-            # Ensure filename ends with .jpg and is valid
-            if not filename.lower().endswith('.jpg'):
-                filename = f"{filename}.jpg"
-            
-            # Remove any invalid characters from filename
-            filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.'))
-            
-            output_path = os.path.join(self.download_dir_var.get(), filename)
-            
-            logging.info(f"Processing file: {filename}, Description: {description}")
-            
-            # Skip if file exists and skip option is enabled
-            if os.path.exists(output_path) and self.skip_var.get():
-                logging.info(f"Skipping existing file: {filename}")
-                self.skipped_downloads += 1
-                self.completed_downloads += 1
-                self.update_progress()
-                return
-            
-            # Create variations of the search query
-            variations = [
-                description,
-                " ".join(description.split()[:4]),  
-                f"product {description}",
-                f"{description} package"
-            ]
-            
-            logging.info(f"Searching with variations for: {description}")
-            image_found = False
-            
-            for variation in variations:
-                if not self.is_running:
-                    return
-                
-                try:
-                    logging.info(f"Trying search variation: {variation}")
-                    results = self.search_images(variation)
-                    
-                    if results:
-                        for result in results:
-                            if not self.is_running:
-                                return
-                                
-                            try:
-                                image_url = result["image"]
-                                logging.info(f"Attempting to download image from: {image_url}")
-                                
-                                # Download and process image
-                                if self.download_and_save_image(image_url, output_path, max_size):
-                                    image_found = True
-                                    self.successful_downloads += 1
-                                    break
-                            except Exception as e:
-                                logging.error(f"Error processing image result: {str(e)}")
-                                continue
-                    
-                    if image_found:
-                        break
-                        
-                except Exception as e:
-                    logging.error(f"Error searching with variation '{variation}': {str(e)}")
-                    continue
-            
-            if not image_found:
-                logging.warning(f"No images found for filename {filename} after trying variations")
-                self.failed_downloads += 1
-            
-            self.completed_downloads += 1
-            self.update_progress()
-            
-        except Exception as e:
-            logging.error(f"Error processing item: {str(e)}")
-            logging.error(traceback.format_exc())
-            self.failed_downloads += 1
-            self.completed_downloads += 1
-            self.update_progress()
-        return False
+        return engine.search_images(query, max_results)
     
-    def download_and_save_image(self, url, output_path, max_size):
+    def download_process(self, excel_path, max_size, concurrent_limit, retry_failed=False):
         try:
-            logging.debug(f"Downloading image from URL: {url}")
-            requests = LazyLoader.requests()
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                logging.debug(f"Download successful for URL: {url}")
-                Image, _ = LazyLoader.pillow()
-                img = Image.open(BytesIO(response.content))
-                
-                logging.debug(f"Original image mode: {img.mode}")
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'P'):
-                    logging.debug(f"Converting {img.mode} to RGB")
-                    img = img.convert('RGB')
-                elif img.mode != 'RGB':
-                    logging.debug(f"Converting {img.mode} to RGB")
-                    img = img.convert('RGB')
-                
-                # Resize image while maintaining aspect ratio
-                if max(img.size) > max_size:
-                    ratio = max_size / max(img.size)
-                    new_size = tuple(int(dim * ratio) for dim in img.size)
-                    logging.debug(f"Resizing image from {img.size} to {new_size}")
-                    img = img.resize(new_size, Image.Resampling.LANCZOS)
-                
-                logging.debug(f"Saving image to: {output_path}")
-                img.save(output_path, "JPEG", quality=85, optimize=True)
-                return True
-        except Exception as e:
-            logging.error(f"Error downloading and saving image from {url}: {str(e)}")
-            return False
-    
-    def download_process(self, excel_path, max_size, concurrent_limit):
-        try:
-            logging.info("Starting download process")
-            output_dir = self.download_dir_var.get()
-            os.makedirs(output_dir, exist_ok=True)
-            
-            logging.info(f"Reading Excel file: {excel_path}")
-            pd = LazyLoader.pandas()
-            df = pd.read_excel(excel_path)
-            self.total_downloads = len(df)
-            self.completed_downloads = 0
-            self.skipped_downloads = 0
-            self.failed_downloads = 0
-            self.successful_downloads = 0
-            logging.info(f"Total items to process: {self.total_downloads}")
-            self.update_progress()
-            
-            concurrent = LazyLoader.concurrent_futures()
-            with concurrent.ThreadPoolExecutor(max_workers=concurrent_limit) as executor:
-                futures = []
-                for index, row in df.iterrows():
-                    if not self.is_running:
-                        break
-                    futures.append(executor.submit(self.process_item, row, output_dir, max_size))
-                
-                # Wait for all futures to complete
-                for future in concurrent.as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        logging.error(f"Error in future: {str(e)}")
-                        logging.error(traceback.format_exc())
+            self.engine = engine.BatchEngine(
+                excel_path=excel_path,
+                output_dir=self.download_dir_var.get(),
+                filename_column=self.filename_column_var.get(),
+                description_column=self.description_column_var.get(),
+                max_size=max_size,
+                concurrent_limit=concurrent_limit,
+                skip_existing=self.skip_var.get(),
+                settings=self.config,
+                retry_failed=retry_failed
+            )
+            if self.is_running:
+                self.engine.run()
             
-            logging.info("Download process completed")
             messagebox.showinfo("Complete", "Download process completed!")
             
         except Exception as e:
@@ -887,12 +823,13 @@ class ImageDownloaderApp:
         finally:
             self.is_running = False
             self.start_button.configure(state="normal")
+            self.retry_button.configure(state="normal")
             self.stop_button.configure(state="disabled")
     
-    def start_download(self):
+    def start_download(self, retry_failed=False):
         try:
             excel_path = self.file_path.get()
-            if not excel_path:
+            if not excel_path and not retry_failed:
                 logging.warning("No Excel file selected")
                 self.log_message("Please select an Excel file first!")
                 return
@@ -903,6 +840,7 @@ class ImageDownloaderApp:
             logging.info(f"Parameters - Max size: {max_size}, Concurrent limit: {concurrent_limit}")
             
             self.start_button.configure(state="disabled")
+            self.retry_button.configure(state="disabled")
             self.stop_button.configure(state="normal")
             self.is_running = True
             
@@ -910,21 +848,31 @@ class ImageDownloaderApp:
             self.save_preferences()
             
             # Start download process in a new thread
-            thread = threading.Thread(target=self.download_process, args=(excel_path, max_size, concurrent_limit))
+            thread = threading.Thread(target=self.download_process, args=(excel_path, max_size, concurrent_limit, retry_failed))
             thread.daemon = True  
+            self.download_thread = thread
             thread.start()
+            self.poll_progress()
             
         except Exception as e:
             logging.error(f"Error starting download: {str(e)}")
             logging.error(traceback.format_exc())
             self.log_message(f"Error starting download: {str(e)}")
     
+    def retry_failed_downloads(self):
+        """Re-run only the rows the job journal recorded as failed"""
+        self.log_message("Retrying failed rows from the job journal")
+        self.start_download(retry_failed=True)
+    
     def stop_download(self):
         if self.is_running:
             logging.info("Stopping download process")
             self.is_running = False
+            if self.engine is not None:
+                self.engine.stop()
             self.status_label.configure(text="Download stopped")
             self.start_button.configure(state="normal")
+            self.retry_button.configure(state="normal")
             self.stop_button.configure(state="disabled")
             self.log_message("Download process stopped by user")
     
@@ -938,11 +886,6 @@ class ImageDownloaderApp:
                 output_dir = self.download_dir_var.get()
                 logging.info(f"Searching for images in directory: {output_dir}")
                 
-                # Debug current settings
-                logging.info(f"Excel file path: {self.file_path.get()}")
-                logging.info(f"Filename column: {self.filename_column_var.get()}")
-                logging.info(f"Description column: {self.description_column_var.get()}")
-                
                 if not os.path.exists(output_dir):
                     logging.error(f"Output directory does not exist: {output_dir}")
                     messagebox.showerror("Error", f"Output directory not found: {output_dir}")
@@ -952,27 +895,14 @@ class ImageDownloaderApp:
                 descriptions = {}
                 if os.path.exists(self.file_path.get()):
                     try:
-                        pd = LazyLoader.pandas()
-                        df = pd.read_excel(self.file_path.get())
                         filename_col = self.filename_column_var.get()
                         desc_col = self.description_column_var.get()
                         
-                        logging.info(f"Excel columns found: {list(df.columns)}")
-                        logging.info(f"Sample data: {df[[filename_col, desc_col]].head()}")
-                        
-                        for _, row in df.iterrows():
-                            base_filename = str(row[filename_col]).strip()
-                            description = str(row[desc_col]).strip()
-                            
-                            # Store both with and without .jpg
-                            filename_with_jpg = f"{base_filename}.jpg"
-                            descriptions[base_filename] = description
-                            descriptions[filename_with_jpg] = description
-                            
-                            logging.info(f"Mapped description for {base_filename}: {description}")
-                            
+                        # Keyed by output file name; the sheet is only parsed if it changed
+                        descriptions = get_description_index().descriptions(
+                            self.file_path.get(), filename_col, desc_col
+                        )
                         logging.info(f"Found {len(descriptions)} descriptions in Excel")
-                        logging.info(f"Description mappings: {descriptions}")
                     except Exception as e:
                         logging.error(f"Error reading Excel file: {str(e)}")
                         logging.error(traceback.format_exc())
@@ -980,33 +910,23 @@ class ImageDownloaderApp:
                 else:
                     logging.warning(f"Excel file not found: {self.file_path.get()}")
                 
-                # Add all images to gallery
-                image_count = 0
-                for filename in os.listdir(output_dir):
+                # List the images; widgets and thumbnails are created as they scroll into view
+                images = []
+                for filename in sorted(os.listdir(output_dir)):
                     if filename.lower().endswith('.jpg'):
                         image_path = os.path.join(output_dir, filename)
-                        base_filename = filename[:-4]  
                         
                         # Try to find description
-                        description = descriptions.get(base_filename, descriptions.get(filename, "No description available"))
-                        logging.info(f"Image {filename} -> base: {base_filename} -> description: {description}")
-                        
-                        self.gallery_window.add_image(filename, description, image_path)
-                        image_count += 1
+                        description = descriptions.get(filename, "No description available")
+                        images.append((filename, description, image_path))
                 
-                logging.info(f"Added {image_count} images to gallery")
+                logging.info(f"Added {len(images)} images to gallery")
                 
-                if image_count == 0:
+                if not images:
                     messagebox.showinfo("Info", f"No images found in {output_dir}")
                     return
                 
-                # Configure grid columns
-                for i in range(self.gallery_window.images_per_row):
-                    self.gallery_window.scrollable_frame.grid_columnconfigure(i, weight=1, minsize=250)
-                
-                # Update canvas scroll region
-                self.gallery_window.scrollable_frame.update_idletasks()
-                self.gallery_window.canvas.configure(scrollregion=self.gallery_window.canvas.bbox("all"))
+                self.gallery_window.set_images(images)
                 
         except Exception as e:
             logging.error(f"Error showing gallery: {str(e)}")
@@ -1023,7 +943,8 @@ class ImageDownloaderApp:
     
     def save_preferences(self):
         """Save current settings to config file"""
-        current_config = {
+        # Only the widget-backed keys; settings without a widget keep following the defaults
+        changes = {
             "description_column": self.description_column_var.get(),
             "filename_column": self.filename_column_var.get(),
             "max_size": self.max_size_var.get(),
@@ -1031,7 +952,8 @@ class ImageDownloaderApp:
             "skip_existing": self.skip_var.get(),
             "download_directory": self.download_dir_var.get()
         }
-        config.save_config(current_config)
+        config.update_config(changes)
+        self.config = {**self.config, **changes}
         logging.info("Preferences saved")
 
     def browse_download_dir(self):
@@ -1049,33 +971,8 @@ class ImageDownloaderApp:
         self.window.mainloop()
 
 if __name__ == "__main__":
-    def setup_logging():
-        # Remove all existing handlers
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-            if hasattr(handler, 'close'):
-                handler.close()
-                
-        # Create logs directory if it doesn't exist
-        log_dir = "logs"
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # Create a new log file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = os.path.join(log_dir, f"image_downloader_{timestamp}.log")
-        
-        # Configure logging
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()  
-            ]
-        )
-        logging.info("Logging initialized")
-        return log_file
-
-    log_file = setup_logging()
+    log_file = setup_logging(config.load_config())
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(engine.main(sys.argv[2:]))
     app = ImageDownloaderApp()
     app.run()
@@ -0,0 +1,412 @@
+"""Download backends used by the batch engine to fetch candidate image bytes"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import closing
+import config
+from lazy_loader import LazyLoader
+from download_cache import get_download_cache
+from log_setup import hot_log
+
+
+def _validator_headers(headers):
+    """Pick the cache validators out of a case-insensitive response header mapping"""
+    return {"ETag": headers.get("ETag"), "Last-Modified": headers.get("Last-Modified")}
+
+
+class _BodyReader:
+    """Collects a streamed response body within a byte budget and a deadline.
+
+    should_continue, when given, is checked on every chunk, so a download
+    nobody wants any more (a lost hedged race, Stop) ends mid-stream.
+    """
+
+    def __init__(self, url, max_bytes, deadline, screening, should_continue=None):
+        self.url = url
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.screening = screening
+        self.should_continue = should_continue
+        self.buffer = bytearray()
+
+    def feed(self, chunk):
+        """Add a chunk; False means abandon the download"""
+        if self.should_continue is not None and not self.should_continue():
+            return False
+        self.buffer += chunk
+        if self.max_bytes and len(self.buffer) > self.max_bytes:
+            hot_log.warning("Abandoning download larger than %d bytes: %s", self.max_bytes, self.url)
+            return False
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            hot_log.warning("Abandoning download that ran past its deadline: %s", self.url)
+            return False
+        return self.screening is None or self.screening.feed(chunk)
+
+    def finish(self):
+        """The whole body, or None if the screen rejected it"""
+        if self.screening is not None and not self.screening.finish():
+            return None
+        return bytes(self.buffer)
+
+
+class Fetcher:
+    """Base class: fetch(url) returns the body bytes, or None if the download failed.
+
+    Backends implement _request(url, headers, should_continue) -> (status, body, validators).
+    With a DownloadCache attached, fresh entries are read from disk and
+    stale ones are revalidated with a conditional request. Bodies are
+    streamed, and a download is abandoned once it passes max_bytes or
+    total_timeout. With a CandidateFilter attached as screen, it is also
+    abandoned as soon as its headers or first bytes rule it out. With a
+    RunMetrics attached as metrics, every network request's latency and
+    downloaded body size are recorded.
+    """
+
+    CHUNK_SIZE = 16384
+
+    def __init__(self, cache=None, screen=None, max_bytes=None, total_timeout=None):
+        self.cache = cache
+        self.screen = screen
+        self.max_bytes = max_bytes
+        self.total_timeout = total_timeout
+        self.metrics = None
+
+    def _request(self, url, headers, should_continue=None):
+        raise NotImplementedError
+
+    def _observe(self, started, data):
+        if self.metrics is not None:
+            self.metrics.observe("fetch", time.monotonic() - started)
+            if data:
+                self.metrics.add_bytes(len(data))
+
+    def _start_body(self, url, headers, started, should_continue=None):
+        """Reader for a 200 response's body; None if its headers already rule it out"""
+        length = headers.get("Content-Length")
+        if self.max_bytes and length and length.isdigit() and int(length) > self.max_bytes:
+            hot_log.warning("Skipping download of %s bytes (limit %d): %s", length, self.max_bytes, url)
+            return None
+        screening = None
+        if self.screen is not None:
+            screening = self.screen.start(url, headers)
+            if screening is None:
+                return None
+        deadline = started + self.total_timeout if self.total_timeout else None
+        return _BodyReader(url, self.max_bytes, deadline, screening, should_continue)
+
+    def _lookup(self, url):
+        """Return (cached entry or None, headers for the request)"""
+        if self.cache is None:
+            return None, {}
+        try:
+            cached = self.cache.get(url)
+        except Exception as e:
+            logging.error(f"Error reading download cache: {str(e)}")
+            return None, {}
+        return cached, (cached.validators() if cached is not None else {})
+
+    def _serve_cached(self, url, cached):
+        try:
+            self.cache.touch(url)
+            self.cache.record(hit=True)
+        except Exception as e:
+            logging.error(f"Error updating download cache: {str(e)}")
+        return cached.data
+
+    def _settle(self, url, cached, status, data, validators):
+        """Turn a response into body bytes, updating the cache"""
+        if self.cache is not None:
+            try:
+                if status == 304 and cached is not None:
+                    self.cache.touch(url, revalidated=True)
+                    self.cache.record(revalidated=True)
+                    return cached.data
+                self.cache.record()
+                if status == 200 and data:
+                    self.cache.put(url, data, validators.get("ETag"), validators.get("Last-Modified"))
+            except Exception as e:
+                logging.error(f"Error updating download cache: {str(e)}")
+        return data if status == 200 else None
+
+    def fetch(self, url, should_continue=None):
+        """Body bytes or None; should_continue returning False abandons the download"""
+        if should_continue is not None and not should_continue():
+            return None
+        cached, headers = self._lookup(url)
+        if cached is not None and cached.fresh:
+            return self._serve_cached(url, cached)
+        status, data, validators = self._request(url, headers, should_continue)
+        return self._settle(url, cached, status, data, validators)
+
+    def fetch_many(self, urls, prefetch=1):
+        """Yield (url, data) in order. Backends that can overlap requests override this"""
+        for url in urls:
+            yield url, self.fetch(url)
+
+    def close(self):
+        pass
+
+
+class RequestsFetcher(Fetcher):
+    """Blocking downloads with requests, one per calling thread, over the shared connection pool.
+
+    read_timeout is a stall timeout: it bounds the wait for each chunk, while
+    total_timeout bounds the whole download.
+    """
+
+    def __init__(self, connect_timeout=5, read_timeout=10, total_timeout=30, max_bytes=None,
+                 cache=None, screen=None):
+        super().__init__(cache, screen, max_bytes, total_timeout)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def _request(self, url, headers, should_continue=None):
+        started = time.monotonic()
+        result = self._download(url, headers, started, should_continue)
+        self._observe(started, result[1])
+        return result
+
+    def _download(self, url, headers, started, should_continue):
+        try:
+            hot_log.debug("Downloading image from URL: %s", url)
+            response = LazyLoader.http_client().get(
+                url, headers=headers, timeout=(self.connect_timeout, self.read_timeout), stream=True
+            )
+            with closing(response):
+                if response.status_code not in (200, 304):
+                    hot_log.debug("Download failed with status %s for URL: %s", response.status_code, url)
+                    return response.status_code, None, {}
+                data = None
+                if response.status_code == 200:
+                    data = self._read_body(url, response, started, should_continue)
+                    if data is None:
+                        return None, None, {}
+                hot_log.debug("Download successful for URL: %s", url)
+                return response.status_code, data, _validator_headers(response.headers)
+        except Exception as e:
+            hot_log.error("Error downloading image from %s: %s", url, e)
+            return None, None, {}
+
+    def _read_body(self, url, response, started, should_continue):
+        reader = self._start_body(url, response.headers, started, should_continue)
+        if reader is None:
+            return None
+        # Read whatever has arrived instead of iter_content, which blocks until a
+        # whole chunk is in, so a trickling server could hold the thread for
+        # CHUNK_SIZE read timeouts; each wait is also cut off at the deadline.
+        # urllib3 before 2.0 has no read1, and read() then waits for a full chunk.
+        raw = response.raw
+        read = getattr(raw, "read1", None) or raw.read
+        sock = getattr(getattr(raw, "connection", None), "sock", None)
+        while True:
+            if reader.deadline is not None and sock is not None:
+                sock.settimeout(max(0.001, min(self.read_timeout, reader.deadline - time.monotonic())))
+            try:
+                chunk = read(self.CHUNK_SIZE, decode_content=True)
+            except Exception:
+                if reader.deadline is not None and time.monotonic() >= reader.deadline:
+                    hot_log.warning("Abandoning download that ran past its deadline: %s", url)
+                    return None
+                raise
+            if not chunk:
+                return reader.finish()
+            if not reader.feed(chunk):
+                return None
+
+
+class AsyncFetcher(Fetcher):
+    """aiohttp downloads on a private event loop thread.
+
+    fetch() and fetch_many() hand URLs to the loop and wait on the result,
+    so a blocking row thread keeps at most prefetch downloads going. The
+    staged pipeline uses begin() and complete() instead, so its rows wait
+    for downloads without holding a thread each, and up to max_in_flight
+    requests run at once. The connector caps total and per-host
+    connections. Cache reads and writes happen in the calling threads, never
+    on the loop.
+    """
+
+    def __init__(self, max_in_flight=256, limit_per_host=8, total_timeout=30,
+                 connect_timeout=10, read_timeout=15, max_bytes=None, cache=None, screen=None):
+        super().__init__(cache, screen, max_bytes, total_timeout)
+        self.max_in_flight = max_in_flight
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="async-fetcher", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._open_session(), loop).result()
+                self._loop, self._thread = loop, thread
+        return self._loop
+
+    async def _open_session(self):
+        aiohttp = LazyLoader.aiohttp()
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, limit_per_host=self.limit_per_host)
+        timeout = aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def _request_async(self, url, headers, should_continue=None):
+        started = time.monotonic()
+        result = await self._download(url, headers, started, should_continue)
+        self._observe(started, result[1])
+        return result
+
+    async def _download(self, url, headers, started, should_continue):
+        try:
+            hot_log.debug("Downloading image from URL: %s", url)
+            async with self._session.get(url, headers=headers) as response:
+                if response.status not in (200, 304):
+                    hot_log.debug("Download failed with status %s for URL: %s", response.status, url)
+                    return response.status, None, {}
+                data = None
+                if response.status == 200:
+                    data = await self._read_body(url, response, started, should_continue)
+                    if data is None:
+                        return None, None, {}
+                hot_log.debug("Download successful for URL: %s", url)
+                return response.status, data, _validator_headers(response.headers)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            hot_log.error("Error downloading image from %s: %s", url, str(e) or type(e).__name__)
+            return None, None, {}
+
+    async def _read_body(self, url, response, started, should_continue):
+        reader = self._start_body(url, response.headers, started, should_continue)
+        if reader is None:
+            return None
+        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+            if not reader.feed(chunk):
+                return None
+        return reader.finish()
+
+    def _submit(self, url, headers, should_continue=None):
+        return asyncio.run_coroutine_threadsafe(
+            self._request_async(url, headers, should_continue), self._ensure_loop()
+        )
+
+    def _request(self, url, headers, should_continue=None):
+        return self._submit(url, headers, should_continue).result()
+
+    def begin(self, url, should_continue=None):
+        """Start a download unless the cache can answer, without waiting for it.
+
+        Returns (cached, future); future is None when the cache answers, and
+        otherwise a concurrent Future whose callbacks run on the loop thread.
+        Pass both to complete() from an ordinary thread.
+        """
+        cached, headers = self._lookup(url)
+        if cached is not None and cached.fresh:
+            return cached, None
+        return cached, self._submit(url, headers, should_continue)
+
+    def complete(self, url, cached, future):
+        """Body bytes or None for a download started with begin(); updates the cache"""
+        if future is None:
+            return self._serve_cached(url, cached)
+        return self._settle(url, cached, *future.result())
+
+    def fetch_many(self, urls, prefetch=1):
+        """Keep up to prefetch downloads running ahead of the consumer, yielding in order"""
+        urls = iter(urls)
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append((url, *self.begin(url)))
+                if len(pending) >= prefetch:
+                    break
+            while pending:
+                url, cached, future = pending.popleft()
+                next_url = next(urls, None)
+                if next_url is not None:
+                    pending.append((next_url, *self.begin(next_url)))
+                yield url, self.complete(url, cached, future)
+        finally:
+            # The consumer found its image (or stopped); drop the speculative downloads
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+            except Exception as e:
+                logging.error(f"Error closing async session: {str(e)}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = self._thread = self._session = None
+
+
+def _max_bytes(cfg):
+    return int(float(cfg["max_download_mb"]) * 1024 * 1024) or None
+
+
+def create_fetcher(cfg, screen=None):
+    """Build the download backend selected by the download_backend setting"""
+    cache = get_download_cache(cfg)
+    backend = cfg.get("download_backend", "threads")
+    if backend == "asyncio":
+        try:
+            LazyLoader.aiohttp()
+            return AsyncFetcher(
+                max_in_flight=int(cfg["async_max_in_flight"]),
+                limit_per_host=int(cfg["async_limit_per_host"]),
+                total_timeout=float(cfg["download_timeout"]),
+                connect_timeout=float(cfg["connect_timeout"]),
+                read_timeout=float(cfg["read_timeout"]),
+                max_bytes=_max_bytes(cfg),
+                cache=cache,
+                screen=screen
+            )
+        except ImportError:
+            logging.error("download_backend is 'asyncio' but aiohttp is not installed, using threads")
+    elif backend != "threads":
+        logging.warning(f"Unknown download_backend '{backend}', using threads")
+    return RequestsFetcher(
+        connect_timeout=float(cfg["connect_timeout"]),
+        read_timeout=float(cfg["read_timeout"]),
+        total_timeout=float(cfg["download_timeout"]),
+        max_bytes=_max_bytes(cfg),
+        cache=cache,
+        screen=screen
+    )
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def get_shared_fetcher():
+    """Blocking fetcher for the GUI windows, backed by the same download cache as batch runs"""
+    global _shared_fetcher
+    if _shared_fetcher is None:
+        with _shared_fetcher_lock:
+            if _shared_fetcher is None:
+                cfg = config.load_config()
+                _shared_fetcher = RequestsFetcher(
+                    connect_timeout=float(cfg["connect_timeout"]),
+                    read_timeout=float(cfg["read_timeout"]),
+                    total_timeout=float(cfg["download_timeout"]),
+                    max_bytes=_max_bytes(cfg),
+                    cache=get_download_cache(cfg)
+                )
+    return _shared_fetcher
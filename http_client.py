@@ -0,0 +1,85 @@
+"""Shared pooled HTTP client for image downloads"""
+import logging
+import threading
+from lazy_loader import LazyLoader
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    """Keep-alive connection pools shared by every download thread.
+
+    One HTTPAdapter (and its urllib3 pools) is mounted into a Session per
+    thread, so connections to the same CDN are reused across threads while
+    no Session is ever used by two threads at once. pool_maxsize caps the
+    open connections per host; with pool_block set, extra requests wait for
+    a free connection instead of opening more.
+
+    Connection and read errors are retried up to retries times, 429 and 5xx
+    responses only status_retries times: a candidate URL that answers 5xx is
+    usually dead, and the next candidate is a better use of the thread.
+    Retries back off exponentially up to backoff_max seconds, and a
+    Retry-After header is honoured up to retry_after_max seconds, so one
+    CDN can't park a download thread for hours.
+    """
+
+    def __init__(self, pool_connections=32, pool_maxsize=8, retries=3, status_retries=1, backoff_factor=0.5,
+                 backoff_max=4, retry_after_max=10):
+        requests = LazyLoader.requests()
+        from urllib3.util.retry import Retry
+        options = dict(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=min(status_retries, retries),
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False
+        )
+        try:
+            retry = Retry(
+                **options,
+                backoff_max=backoff_max,
+                retry_after_max=retry_after_max,
+                respect_retry_after_header=True
+            )
+        except TypeError:
+            # urllib3 before 2.6 can't cap Retry-After, so don't sleep on it at all
+            logging.warning("This urllib3 can't cap Retry-After waits; ignoring Retry-After headers")
+            retry = Retry(**options, respect_retry_after_header=False)
+        self.adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+            max_retries=retry
+        )
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            pool_connections=int(cfg["http_pool_connections"]),
+            pool_maxsize=int(cfg["http_pool_maxsize"]),
+            retries=int(cfg["http_retries"]),
+            status_retries=int(cfg["http_status_retries"]),
+            backoff_factor=float(cfg["http_backoff_factor"]),
+            backoff_max=float(cfg["http_backoff_max"]),
+            retry_after_max=int(cfg["http_retry_after_max"])
+        )
+
+    def session(self):
+        """This thread's Session, mounted on the shared adapter"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = LazyLoader.requests().Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session().get(url, **kwargs)
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,173 @@
+"""Perceptual-hash index of the images in the download directory"""
+import os
+import sqlite3
+import logging
+import threading
+from collections import defaultdict
+from lazy_loader import LazyLoader
+from imaging import dhash_image
+
+INDEX_FILENAME = ".image_hashes.sqlite3"
+HASH_BITS = 64
+# Flat images (blank placeholders, solid colours) all hash to 0 whatever their colour
+FLAT_HASH = 0
+
+
+class ImageHashIndex:
+    """dHash of every .jpg in the download directory, kept in a SQLite file next to them.
+
+    Opening the index reads the stored hashes and stats the directory; only
+    files whose size or mtime changed since they were hashed are decoded
+    again. Lookups find any image within max_distance bits (Hamming) of a
+    hash: the 64 bits are split into max_distance + 1 bands, and two hashes
+    that close must agree exactly on at least one band, so only images
+    sharing a band bucket are compared. Flat images carry no structure to
+    compare, so they are never reported as duplicates.
+    """
+
+    COMMIT_EVERY = 50
+
+    def __init__(self, output_dir, max_distance=4):
+        self.output_dir = output_dir
+        self.max_distance = max(0, min(int(max_distance), HASH_BITS - 1))
+        self.duplicates = 0
+        self._hashes = {}
+        self._buckets = defaultdict(set)
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+
+        bands = self.max_distance + 1
+        width, extra = divmod(HASH_BITS, bands)
+        self._bands = []
+        shift = 0
+        for band in range(bands):
+            bits = width + (1 if band < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+
+        self._conn = sqlite3.connect(os.path.join(output_dir, INDEX_FILENAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " filename TEXT PRIMARY KEY,"
+            " hash TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+        self._sync()
+
+    def _keys(self, value):
+        return [(band, (value >> shift) & mask) for band, (shift, mask) in enumerate(self._bands)]
+
+    def _insert(self, filename, value):
+        self._remove(filename)
+        self._hashes[filename] = value
+        if value == FLAT_HASH:
+            return
+        for key in self._keys(value):
+            self._buckets[key].add(filename)
+
+    def _remove(self, filename):
+        value = self._hashes.pop(filename, None)
+        if value is not None:
+            for key in self._keys(value):
+                self._buckets[key].discard(filename)
+
+    def _sync(self):
+        """Bring the index up to date with the directory, rehashing only changed files"""
+        stored = {
+            filename: (int(value, 16), size, mtime_ns)
+            for filename, value, size, mtime_ns in self._conn.execute(
+                "SELECT filename, hash, size, mtime_ns FROM hashes"
+            )
+        }
+        changed = []
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith('.jpg') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                known = stored.pop(entry.name, None)
+                if known is not None and known[1:] == (stat.st_size, stat.st_mtime_ns):
+                    self._insert(entry.name, known[0])
+                else:
+                    changed.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        if stored:
+            self._conn.executemany("DELETE FROM hashes WHERE filename = ?", [(name,) for name in stored])
+        if changed:
+            logging.info(f"Hashing {len(changed)} new or changed images in {self.output_dir}")
+            concurrent = LazyLoader.concurrent_futures()
+            paths = [os.path.join(self.output_dir, name) for name, _, _ in changed]
+            with concurrent.ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+                values = list(executor.map(self._hash_file, paths))
+            rows = []
+            for (name, size, mtime_ns), value in zip(changed, values):
+                if value is not None:
+                    self._insert(name, value)
+                    rows.append((name, f"{value:016x}", size, mtime_ns))
+            self._conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)", rows)
+        self._conn.commit()
+        logging.info(f"Image hash index loaded: {len(self._hashes)} images")
+
+    @staticmethod
+    def _hash_file(path):
+        try:
+            return dhash_image(path)
+        except Exception as e:
+            logging.error(f"Error hashing image {path}: {str(e)}")
+            return None
+
+    def _find(self, value, exclude):
+        if value == FLAT_HASH:
+            return None
+        seen = set()
+        for key in self._keys(value):
+            for filename in self._buckets.get(key, ()):
+                if filename == exclude or filename in seen:
+                    continue
+                seen.add(filename)
+                if bin(self._hashes[filename] ^ value).count("1") <= self.max_distance:
+                    return filename
+        return None
+
+    def claim(self, filename, value):
+        """Reserve value for filename; returns the image it duplicates instead, if any.
+
+        Checking and reserving happen under one lock, so two rows that find
+        the same photo at the same time cannot both keep it.
+        """
+        with self._lock:
+            duplicate = self._find(value, filename)
+            if duplicate is not None:
+                self.duplicates += 1
+                return duplicate
+            self._insert(filename, value)
+            return None
+
+    def release(self, filename):
+        """Drop a claim whose image was never written"""
+        with self._lock:
+            self._remove(filename)
+
+    def commit(self, filename, path):
+        """Persist the claimed hash of filename now that the image is on disk"""
+        stat = os.stat(path)
+        with self._lock:
+            value = self._hashes.get(filename)
+            if value is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                (filename, f"{value:016x}", stat.st_size, stat.st_mtime_ns)
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
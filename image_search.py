@@ -0,0 +1,135 @@
+"""Shared DuckDuckGo image search used by the batch engine and the GUI windows"""
+import os
+import logging
+import threading
+import config
+from lazy_loader import LazyLoader
+from search_cache import SearchCache
+from rate_limit import AdaptiveRateLimiter
+from log_setup import hot_log
+
+
+def is_rate_limit_error(error):
+    """True for duckduckgo_search's RatelimitException.
+
+    Judged by the exception type only: the message carries the request URL
+    and query, so a "429" in a SKU would otherwise pause every thread.
+    """
+    try:
+        from duckduckgo_search.exceptions import RatelimitException
+        if isinstance(error, RatelimitException):
+            return True
+    except ImportError:
+        pass
+    return any("ratelimit" in cls.__name__.lower() for cls in type(error).__mro__)
+
+
+class ImageSearcher:
+    """Wraps DDGS.images with an optional persistent result cache and a shared rate limiter.
+
+    Rate-limit errors are not treated as "no results": the limiter backs
+    off for every thread and the same query is retried, up to
+    rate_limit_retries times.
+    """
+
+    def __init__(self, cache=None, safesearch="off", limiter=None, rate_limit_retries=6):
+        self.cache = cache
+        self.safesearch = safesearch
+        self.limiter = limiter if limiter is not None else AdaptiveRateLimiter()
+        self.rate_limit_retries = rate_limit_retries
+
+    @classmethod
+    def from_config(cls, cfg):
+        cache = None
+        if cfg.get("search_cache_enabled", True):
+            try:
+                cache = SearchCache(
+                    os.path.join(cfg["cache_directory"], "search_cache.sqlite3"),
+                    ttl_seconds=float(cfg["search_cache_ttl_hours"]) * 3600,
+                    max_entries=int(cfg["search_cache_max_entries"])
+                )
+            except Exception as e:
+                logging.error(f"Error opening search cache, searching without it: {str(e)}")
+        return cls(
+            cache=cache,
+            limiter=AdaptiveRateLimiter.from_config(cfg),
+            rate_limit_retries=int(cfg["search_rate_limit_retries"])
+        )
+
+    def search(self, query, max_results=5, should_continue=None):
+        """Search for images using DuckDuckGo.
+
+        should_continue lets a batch run abandon a search that is waiting
+        out a rate-limit backoff when the user presses Stop.
+        """
+        results = self.lookup(query, max_results, should_continue)
+        return results if results is not None else []
+
+    def lookup(self, query, max_results=5, should_continue=None):
+        """Like search, but None when the search failed or was abandoned instead of []"""
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(query, max_results, self.safesearch)
+                if cached is not None:
+                    hot_log.info("Found %d cached images for query: %s", len(cached), query)
+                    return cached
+            except Exception as e:
+                logging.error(f"Error reading search cache: {str(e)}")
+
+        results = self._search_with_retries(query, max_results, should_continue)
+        if results is None:
+            return None
+
+        # Only successful searches are cached, so a transient error is retried next time
+        if self.cache is not None:
+            try:
+                self.cache.put(query, max_results, self.safesearch, results)
+            except Exception as e:
+                logging.error(f"Error writing search cache: {str(e)}")
+        return results
+
+    def _search_with_retries(self, query, max_results, should_continue):
+        """Return the results, or None if the search failed or was abandoned"""
+        for attempt in range(self.rate_limit_retries + 1):
+            if not self.limiter.acquire(should_continue):
+                return None
+            try:
+                ddgs = LazyLoader.ddgs()
+                with ddgs() as ddg:
+                    results = list(ddg.images(
+                        keywords=query,
+                        max_results=max_results,
+                        safesearch=self.safesearch
+                    ))
+                self.limiter.on_success()
+                hot_log.info("Found %d images for query: %s", len(results), query)
+                return results
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    logging.error(f"Error searching for images: {str(e)}")
+                    return None
+                pause = self.limiter.on_rate_limited()
+                logging.warning(
+                    f"Search rate limited (attempt {attempt + 1}), backing off {pause:.1f}s, "
+                    f"rate now {self.limiter.rate:.2f}/s"
+                )
+        logging.error(f"Giving up on query after {self.rate_limit_retries} rate-limit retries: {query}")
+        return None
+
+    def stats(self):
+        stats = self.cache.stats() if self.cache is not None else {"hits": 0, "misses": 0}
+        return {**stats, **self.limiter.stats()}
+
+
+_searcher = None
+_searcher_lock = threading.Lock()
+
+
+def get_searcher():
+    """Return the process-wide searcher, created from the saved preferences on first use"""
+    global _searcher
+    if _searcher is None:
+        with _searcher_lock:
+            if _searcher is None:
+                _searcher = ImageSearcher.from_config(config.load_config())
+    return _searcher
@@ -0,0 +1,298 @@
+"""Image decode/resize/encode helpers.
+
+Everything here works on plain bytes and module-level functions, so it can
+run in a worker process as well as in the calling thread.
+"""
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from io import BytesIO
+from lazy_loader import LazyLoader
+
+# What a Transcoder job produces: the JPEG, plus its thumbnail and dHash when asked for
+TranscodeResult = namedtuple("TranscodeResult", "encoded thumbnail dhash")
+
+
+def load_image(source, target_size):
+    """Open an image as RGB, no larger than target_size on its longest side.
+
+    For JPEG sources much larger than the target, the decoder is told to
+    produce a 1/2, 1/4 or 1/8 scale image directly (Image.draft), so a
+    multi-megapixel photo is never fully decoded just to be shrunk. The
+    draft keeps at least twice the target size and a LANCZOS resample does
+    the final step, so quality matches a full decode.
+    """
+    return fit_image(decode_image(source, target_size), target_size)
+
+
+def decode_image(source, target_size):
+    """The decode half of load_image: open, draft-scale for target_size and load as RGB"""
+    Image = LazyLoader.image()
+    img = Image.open(source)
+
+    if max(img.size) > target_size * 2:
+        # Only JPEG supports this; for other formats draft() does nothing
+        scale = target_size * 2 / max(img.size)
+        img.draft('RGB', tuple(max(1, int(dim * scale)) for dim in img.size))
+
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.load()
+    return img
+
+
+def fit_image(img, target_size):
+    """The resize half of load_image"""
+    Image = LazyLoader.image()
+    # Resize image while maintaining aspect ratio
+    if max(img.size) > target_size:
+        ratio = target_size / max(img.size)
+        new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+    return img
+
+
+# Leading bytes of the formats Pillow decodes without plugins
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+
+
+def sniff_format(head):
+    """Name of the supported image format the bytes start with, or None (an HTML error page, say)"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, name in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return name
+    return None
+
+
+def transcode_image(data, max_size, quality=85):
+    """Decode downloaded bytes, convert to RGB, shrink to max_size and encode as JPEG bytes.
+
+    Raises if the data is not a decodable image.
+    """
+    return transcode_image_timed(data, max_size, quality)[0].encoded
+
+
+def transcode_image_timed(data, max_size, quality=85, thumbnail_size=None, thumbnail_quality=80,
+                          with_hash=False):
+    """Returns (TranscodeResult, seconds spent in each of decode, resize and encode).
+
+    With thumbnail_size the result also carries a JPEG thumbnail made from
+    the resized image, and with with_hash the dHash of the encoded JPEG, so
+    the caller never decodes the image again for them.
+    """
+    started = time.perf_counter()
+    img = decode_image(BytesIO(data), max_size)
+    decoded = time.perf_counter()
+    img = fit_image(img, max_size)
+    resized = time.perf_counter()
+    output = BytesIO()
+    img.save(output, "JPEG", quality=quality, optimize=True)
+    encoded = time.perf_counter()
+    timings = {"decode": decoded - started, "resize": resized - decoded, "encode": encoded - resized}
+
+    thumbnail = None
+    if thumbnail_size:
+        small = BytesIO()
+        fit_image(img, thumbnail_size).save(small, "JPEG", quality=thumbnail_quality)
+        thumbnail = small.getvalue()
+    dhash = dhash_image(BytesIO(output.getvalue())) if with_hash else None
+    return TranscodeResult(output.getvalue(), thumbnail, dhash), timings
+
+
+def dhash_image(source):
+    """64-bit difference hash: each bit says whether a pixel is brighter than its right neighbour.
+
+    The image is reduced to 9x8 grayscale first, so resized, recompressed
+    or lightly edited copies of one photo get the same or a nearby hash.
+    """
+    Image = LazyLoader.image()
+    img = Image.open(source)
+    # JPEGs decode at 1/8 scale; the hash only needs 9x8 pixels
+    img.draft('L', (64, 64))
+    pixels = list(img.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _init_worker():
+    """Encode process initializer: load Pillow and its format plugins before the first job"""
+    LazyLoader.image().init()
+
+
+class Transcoder:
+    """Runs transcode_image in a process pool so resizing uses every core.
+
+    Worker threads call transcode() and wait without holding the GIL while a
+    separate process does the decode, resize and encode. With use_processes
+    off, work runs in the calling thread instead. With a metrics sink set,
+    each job's decode, resize and encode times are recorded when it finishes.
+
+    Jobs resolve to a TranscodeResult. With thumbnail_size or with_hash set,
+    the thumbnail and dHash are made in the worker process too, so nothing
+    CPU-heavy is left for the thread (or pool callback) that stores them.
+
+    Pool processes are spawned, not forked: a fork taken while other threads
+    hold the import lock or a logging lock leaves the child blocked forever.
+    Call start() before starting worker threads so the pool exists up front.
+    If the pool breaks, or a job gets no answer within timeout seconds, the
+    pool is dropped for the rest of the run; that job and every job still
+    queued in the pool are redone on a thread pool instead, so submit()
+    futures always settle, whether anyone blocks on them or not.
+    """
+
+    def __init__(self, workers=0, use_processes=True, metrics=None, timeout=60,
+                 thumbnail_size=None, thumbnail_quality=80, with_hash=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.metrics = metrics
+        self.timeout = timeout or None
+        self.options = {
+            "thumbnail_size": thumbnail_size,
+            "thumbnail_quality": thumbnail_quality,
+            "with_hash": with_hash
+        }
+        self._pool = None
+        self._fallback = None
+        self._lock = threading.Lock()
+        # Outer future -> (deadline, data, max_size) for jobs out in the pool
+        self._jobs = {}
+        self._watchdog = None
+        self._closed = threading.Event()
+
+    def start(self):
+        """Create the process pool now instead of on the first submit"""
+        self._get_pool()
+        return self
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.use_processes:
+                concurrent = LazyLoader.concurrent_futures()
+                import multiprocessing
+                self._pool = concurrent.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            return self._pool if self.use_processes else None
+
+    def _abandon_pool(self, reason):
+        """Stop using the pool for the rest of the run and encode in-process"""
+        with self._lock:
+            if not self.use_processes:
+                return
+            logging.error(f"Transcode pool unavailable, encoding in-process: {reason}")
+            self.use_processes = False
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            # Queued jobs come back cancelled and are redone by _settle
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, data, max_size):
+        """Start transcoding and return a Future for a TranscodeResult"""
+        future = LazyLoader.concurrent_futures().Future()
+        pool = self._get_pool()
+        if pool is not None:
+            try:
+                with self._lock:
+                    job = pool.submit(transcode_image_timed, data, max_size, **self.options)
+                    deadline = time.monotonic() + self.timeout if self.timeout else None
+                    self._jobs[future] = (deadline, data, max_size)
+                    self._start_watchdog()
+                job.add_done_callback(lambda job: self._settle(future, job))
+                return future
+            except Exception as e:
+                # BrokenProcessPool or shutdown: keep the run going in-process
+                self._abandon_pool(str(e))
+        self._run(future, data, max_size)
+        return future
+
+    def _run(self, future, data, max_size):
+        try:
+            self._resolve(future, transcode_image_timed(data, max_size, **self.options))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _redo(self, future, data, max_size):
+        """Encode a job the pool dropped on the fallback threads"""
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = LazyLoader.concurrent_futures().ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="encode"
+                )
+            fallback = self._fallback
+        fallback.submit(self._run, future, data, max_size)
+
+    def _settle(self, future, job):
+        with self._lock:
+            # Whoever removes the job settles its future: this callback or the watchdog
+            entry = self._jobs.pop(future, None)
+        if entry is None:
+            return
+        from concurrent.futures.process import BrokenProcessPool
+        if job.cancelled() or isinstance(job.exception(), BrokenProcessPool):
+            # Dropped with the pool, not a bad image: encode it here instead
+            self._abandon_pool("pool shut down or broken")
+            self._redo(future, entry[1], entry[2])
+            return
+        try:
+            self._resolve(future, job.result())
+        except Exception as e:
+            future.set_exception(e)
+
+    def _start_watchdog(self):
+        # Caller holds self._lock
+        if self.timeout and self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="transcode-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def _watch(self):
+        """Redo jobs the pool hasn't answered within timeout, dropping the pool"""
+        while not self._closed.wait(min(1.0, self.timeout / 4)):
+            now = time.monotonic()
+            with self._lock:
+                expired = [(future, entry) for future, entry in self._jobs.items() if entry[0] < now]
+                for future, _ in expired:
+                    del self._jobs[future]
+            if not expired:
+                continue
+            self._abandon_pool(f"no result after {self.timeout}s")
+            for future, (_, data, max_size) in expired:
+                self._redo(future, data, max_size)
+
+    def transcode(self, data, max_size):
+        """Blocking transcode; raises if the data is not a decodable image"""
+        return self.submit(data, max_size).result()
+
+    def _resolve(self, future, result):
+        transcoded, timings = result
+        if self.metrics is not None:
+            for stage, seconds in timings.items():
+                self.metrics.observe(stage, seconds)
+        future.set_result(transcoded)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            pool, self._pool = self._pool, None
+            fallback, self._fallback = self._fallback, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        if fallback is not None:
+            fallback.shutdown(wait=True)
@@ -0,0 +1,151 @@
+"""Per-row job journal so batch runs can resume and retry only failed rows"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+JOURNAL_FILENAME = ".download_journal.sqlite3"
+
+PENDING = "pending"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+SETTLED_STATES = (SUCCEEDED, FAILED, SKIPPED)
+
+
+class JobJournal:
+    """SQLite journal kept next to the downloaded images.
+
+    Each row is stored by output filename with its state, the URL and query
+    variation that produced the image, how many times it was attempted and
+    the run that last settled it. Each run is also recorded, so the next run
+    can tell whether the previous one was interrupted and resume only the
+    rows that run (and the interrupted runs it resumed) settled. Writes are
+    committed in batches to keep the hot path cheap.
+    """
+
+    COMMIT_EVERY = 50
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, JOURNAL_FILENAME)
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._run_id = None
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " filename TEXT PRIMARY KEY,"
+            " description TEXT,"
+            " state TEXT NOT NULL,"
+            " url TEXT,"
+            " variation TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " updated REAL NOT NULL,"
+            " run_id INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_state ON rows(state)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " source TEXT,"
+            " started REAL NOT NULL,"
+            " finished REAL,"
+            " resumed_from INTEGER)"
+        )
+        # Journals written before rows were tied to runs
+        self._add_column("rows", "run_id INTEGER")
+        self._add_column("runs", "resumed_from INTEGER")
+        self._conn.commit()
+
+    def _add_column(self, table, column):
+        name = column.split()[0]
+        if name not in {info[1] for info in self._conn.execute(f"PRAGMA table_info({table})")}:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+    def interrupted_run(self, source):
+        """Id of the most recent run over source if it never reached the end, else None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, finished FROM runs WHERE source = ? ORDER BY id DESC LIMIT 1", (source,)
+            ).fetchone()
+        return row[0] if row is not None and row[1] is None else None
+
+    def last_run_interrupted(self, source):
+        """True if the most recent run over source never reached the end"""
+        return self.interrupted_run(source) is not None
+
+    def settled_by_run(self, run_id):
+        """Filenames settled by run_id, or by the interrupted runs it resumed in turn"""
+        with self._lock:
+            run_ids = []
+            while run_id is not None and run_id not in run_ids:
+                run_ids.append(run_id)
+                row = self._conn.execute("SELECT resumed_from FROM runs WHERE id = ?", (run_id,)).fetchone()
+                run_id = row[0] if row is not None else None
+            marks = ",".join("?" * len(SETTLED_STATES))
+            runs = ",".join("?" * len(run_ids))
+            return {
+                filename for (filename,) in self._conn.execute(
+                    f"SELECT filename FROM rows WHERE state IN ({marks}) AND run_id IN ({runs})",
+                    (*SETTLED_STATES, *run_ids)
+                )
+            }
+
+    def start_run(self, source, resumed_from=None):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (source, started, resumed_from) VALUES (?, ?, ?)",
+                (source, time.time(), resumed_from)
+            )
+            self._run_id = cursor.lastrowid
+            self._conn.commit()
+
+    def finish_run(self):
+        with self._lock:
+            if self._run_id is not None:
+                self._conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self._run_id))
+            self._conn.commit()
+
+    def states(self):
+        """Return {filename: state} for every journaled row"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT filename, state FROM rows"))
+
+    def failed_rows(self):
+        """Return [(filename, description)] for rows whose last attempt failed"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT filename, description FROM rows WHERE state = ? ORDER BY filename", (FAILED,)
+            ).fetchall()
+
+    def mark(self, filename, state, description=None, url=None, variation=None):
+        """Record a row's state; attempts count every pending -> settled transition"""
+        attempted = 1 if state in (SUCCEEDED, FAILED) else 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO rows (filename, description, state, url, variation, attempts, updated, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET "
+                " description = COALESCE(excluded.description, description),"
+                " state = excluded.state,"
+                " url = CASE WHEN excluded.state IN ('pending', 'skipped') THEN url ELSE excluded.url END,"
+                " variation = CASE WHEN excluded.state IN ('pending', 'skipped') THEN variation ELSE excluded.variation END,"
+                " attempts = attempts + excluded.attempts,"
+                " updated = excluded.updated,"
+                " run_id = excluded.run_id",
+                (filename, description, state, url, variation, attempted, time.time(), self._run_id)
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.commit()
+                self._conn.close()
+            except Exception as e:
+                logging.error(f"Error closing job journal: {str(e)}")
@@ -0,0 +1,101 @@
+import threading
+
+
+# Lazy imports - only import when needed
+class LazyLoader:
+    _pandas = None
+    _ddgs = None
+    _pillow = None
+    _image = None
+    _image_file = None
+    _requests = None
+    _aiohttp = None
+    _openpyxl = None
+    _parquet = None
+    _http_client = None
+    _concurrent_futures = None
+    _http_client_lock = threading.Lock()
+    
+    @classmethod
+    def pandas(cls):
+        if cls._pandas is None:
+            import pandas as pd
+            cls._pandas = pd
+        return cls._pandas
+    
+    @classmethod
+    def ddgs(cls):
+        if cls._ddgs is None:
+            from duckduckgo_search import DDGS
+            cls._ddgs = DDGS
+        return cls._ddgs
+    
+    @classmethod
+    def pillow(cls):
+        if cls._pillow is None:
+            from PIL import Image, ImageTk
+            cls._pillow = (Image, ImageTk)
+        return cls._pillow
+    
+    @classmethod
+    def image(cls):
+        """PIL.Image without ImageTk, so headless code never pulls in tkinter"""
+        if cls._image is None:
+            from PIL import Image
+            cls._image = Image
+        return cls._image
+    
+    @classmethod
+    def image_file(cls):
+        """PIL.ImageFile, for incremental parsing of partial downloads"""
+        if cls._image_file is None:
+            from PIL import ImageFile
+            cls._image_file = ImageFile
+        return cls._image_file
+    
+    @classmethod
+    def requests(cls):
+        if cls._requests is None:
+            import requests
+            cls._requests = requests
+        return cls._requests
+    
+    @classmethod
+    def http_client(cls):
+        """Shared pooled HTTP client, configured from the saved preferences"""
+        if cls._http_client is None:
+            # Download threads ask for it at once; building two would split the connection pools
+            with cls._http_client_lock:
+                if cls._http_client is None:
+                    import config
+                    from http_client import HttpClient
+                    cls._http_client = HttpClient.from_config(config.load_config())
+        return cls._http_client
+    
+    @classmethod
+    def aiohttp(cls):
+        if cls._aiohttp is None:
+            import aiohttp
+            cls._aiohttp = aiohttp
+        return cls._aiohttp
+    
+    @classmethod
+    def openpyxl(cls):
+        if cls._openpyxl is None:
+            import openpyxl
+            cls._openpyxl = openpyxl
+        return cls._openpyxl
+    
+    @classmethod
+    def parquet(cls):
+        if cls._parquet is None:
+            import pyarrow.parquet as pq
+            cls._parquet = pq
+        return cls._parquet
+    
+    @classmethod
+    def concurrent_futures(cls):
+        if cls._concurrent_futures is None:
+            import concurrent.futures
+            cls._concurrent_futures = concurrent.futures
+        return cls._concurrent_futures
@@ -0,0 +1,159 @@
+"""Queue-based logging: callers enqueue records, one listener thread formats and writes them.
+
+Hot-path code (per row and per candidate URL) logs through hot_log with
+%-style arguments, so a message below hot_path_log_level is dropped before
+it is formatted. Finished rows are logged through row_log with a
+structured "row" payload that also goes to a JSON-lines file.
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+import time
+from datetime import datetime
+
+HOT_PATH_LOGGER = "fetch_images.hot_path"
+ROW_LOGGER = "fetch_images.rows"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+hot_log = logging.getLogger(HOT_PATH_LOGGER)
+row_log = logging.getLogger(ROW_LOGGER)
+
+_listener = None
+
+
+class RepeatFilter(logging.Filter):
+    """Lets at most limit records per call site through in each window of seconds.
+
+    Call sites are keyed by file and line, so a download error repeated for
+    thousands of URLs costs one dict lookup per record once its budget is
+    spent. The number of records a call site dropped is added to its first
+    message in the next window. Records with a traceback or a row payload
+    are never dropped.
+    """
+
+    def __init__(self, limit=50, window=10.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.exc_info or getattr(record, "row", None) is not None:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+
+class RowJsonFormatter(logging.Formatter):
+    """One JSON object per finished row: time, plus the record's row payload"""
+
+    def format(self, record):
+        return json.dumps(
+            {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"), **record.row},
+            ensure_ascii=False
+        )
+
+
+class _RowsOnly(logging.Filter):
+    def filter(self, record):
+        return getattr(record, "row", None) is not None
+
+
+class _QuietRows(logging.Filter):
+    """Keeps row records out of the text log and console below hot_path_log_level"""
+
+    def __init__(self, level):
+        super().__init__()
+        self.level = level
+
+    def filter(self, record):
+        return getattr(record, "row", None) is None or record.levelno >= self.level
+
+
+def _level(name, default):
+    return getattr(logging, str(name).upper(), default)
+
+
+def setup_logging(cfg, log_dir="logs", console=True):
+    """Route all logging through a queue to the session's log files and, with console, stderr.
+
+    Returns the path of the text log. The listener is flushed and stopped at
+    interpreter exit, or earlier with stop_logging().
+    """
+    global _listener
+    stop_logging()
+    # Remove all existing handlers
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        if hasattr(handler, 'close'):
+            handler.close()
+
+    # Create logs directory if it doesn't exist
+    os.makedirs(log_dir, exist_ok=True)
+
+    # Create new log files with the session's timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_file = os.path.join(log_dir, f"image_downloader_{timestamp}.log")
+    level = _level(cfg["log_level"], logging.DEBUG)
+    hot_level = _level(cfg["hot_path_log_level"], logging.INFO)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file, encoding='utf-8')]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+        # Rows are hot-path messages too; the JSON-lines file below still gets every one
+        handler.addFilter(_QuietRows(hot_level))
+    if cfg["row_log_enabled"]:
+        row_handler = logging.FileHandler(os.path.join(log_dir, f"rows_{timestamp}.jsonl"), encoding='utf-8', delay=True)
+        row_handler.setFormatter(RowJsonFormatter())
+        row_handler.addFilter(_RowsOnly())
+        handlers.append(row_handler)
+
+    # Callers only pay for putting the record on an unbounded queue; the listener does the I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if int(cfg["log_repeat_limit"]) > 0:
+        queue_handler.addFilter(RepeatFilter(int(cfg["log_repeat_limit"]), float(cfg["log_repeat_window"])))
+    logging.root.addHandler(queue_handler)
+    logging.root.setLevel(level)
+    hot_log.setLevel(hot_level)
+    row_log.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    logging.info("Logging initialized")
+    return log_file
+
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,201 @@
+"""Per-stage timings, throughput and variation hit rates for batch runs"""
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+STAGES = ("search", "fetch", "decode", "resize", "encode", "write", "row")
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram.
+
+    Memory is constant however many samples arrive, and quantiles are
+    accurate to one bucket (10%), which is plenty to see where time goes.
+    """
+
+    MIN_SECONDS = 1e-4
+    GROWTH = 1.1
+    BUCKETS = 200
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            index = 0
+        else:
+            index = min(self.BUCKETS, int(math.log(seconds / self.MIN_SECONDS, self.GROWTH)) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile; 0 with no samples"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(self.max, self.MIN_SECONDS * self.GROWTH ** index)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max
+        }
+
+
+class RunMetrics:
+    """Thread-safe metrics sink for one batch run.
+
+    Stages record their latency with observe() or the timer() context
+    manager, fetchers add the bytes they download, and rows report which
+    query variation they tried and which one produced the image.
+    """
+
+    def __init__(self, progress=None, variation_names=()):
+        self.progress = progress
+        self.variation_names = list(variation_names)
+        self.started = time.monotonic()
+        self.bytes_downloaded = 0
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.variations_tried = [0] * len(self.variation_names)
+        self.variations_won = [0] * len(self.variation_names)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_downloaded += count
+
+    def variation_tried(self, index):
+        with self._lock:
+            if index < len(self.variations_tried):
+                self.variations_tried[index] += 1
+
+    def variation_won(self, index):
+        with self._lock:
+            if index < len(self.variations_won):
+                self.variations_won[index] += 1
+
+    def snapshot(self):
+        """Everything as plain data, for the GUI, the JSON summary and the text endpoint"""
+        elapsed = time.monotonic() - self.started
+        progress = self.progress.snapshot()._asdict() if self.progress is not None else {}
+        with self._lock:
+            stages = {name: histogram.summary() for name, histogram in self.stages.items()}
+            variations = [
+                {
+                    "variation": name,
+                    "tried": tried,
+                    "won": won,
+                    "hit_rate": won / tried if tried else 0.0
+                }
+                for name, tried, won in zip(self.variation_names, self.variations_tried, self.variations_won)
+            ]
+            bytes_downloaded = self.bytes_downloaded
+        completed = progress.get("completed", 0)
+        return {
+            "elapsed_seconds": elapsed,
+            "rows": progress,
+            "items_per_second": completed / elapsed if elapsed > 0 else 0.0,
+            "bytes_downloaded": bytes_downloaded,
+            "stages": stages,
+            "variations": variations
+        }
+
+    def write_json(self, path, extra=None):
+        summary = self.snapshot()
+        if extra:
+            summary.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    def prometheus_text(self):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE fetch_images_stage_seconds summary"
+        ]
+        for stage, summary in snapshot["stages"].items():
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                value = summary[key]
+                lines.append(f'fetch_images_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'fetch_images_stage_seconds_sum{{stage="{stage}"}} {summary["total_seconds"]:.6f}')
+            lines.append(f'fetch_images_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        lines.append("# TYPE fetch_images_rows_total counter")
+        for status in ("succeeded", "skipped", "failed"):
+            lines.append(f'fetch_images_rows_total{{status="{status}"}} {snapshot["rows"].get(status, 0)}')
+        lines.append("# TYPE fetch_images_rows_expected gauge")
+        lines.append(f'fetch_images_rows_expected {snapshot["rows"].get("total", 0)}')
+        lines.append("# TYPE fetch_images_items_per_second gauge")
+        lines.append(f'fetch_images_items_per_second {snapshot["items_per_second"]:.6f}')
+        lines.append("# TYPE fetch_images_bytes_downloaded_total counter")
+        lines.append(f'fetch_images_bytes_downloaded_total {snapshot["bytes_downloaded"]}')
+        lines.append("# TYPE fetch_images_variation_tried_total counter")
+        for variation in snapshot["variations"]:
+            lines.append(f'fetch_images_variation_tried_total{{variation="{variation["variation"]}"}} {variation["tried"]}')
+        lines.append("# TYPE fetch_images_variation_won_total counter")
+        for variation in snapshot["variations"]:
+            lines.append(f'fetch_images_variation_won_total{{variation="{variation["variation"]}"}} {variation["won"]}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a RunMetrics as Prometheus text on http://127.0.0.1:<port>/metrics"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Metrics request: {format % args}")
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics on http://{host}:{self._server.server_port}/metrics")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,305 @@
+"""Staged batch pipeline: search threads -> fetch threads -> encode processes.
+
+Each stage has its own workers and a bounded queue in front of it, so a
+slow LANCZOS resize never holds a network slot and a slow search never
+holds a CPU. A row moves forward through the stages and moves back when a
+later stage rejects it: an undecodable or duplicate candidate goes back to the fetch
+stage for the next URL, and a variation with no usable candidates goes
+back to the search stage for the next variation. Those hand-backs use
+unbounded retry queues so no worker ever blocks on a stage behind it.
+
+With the asyncio download backend, rows don't hold a fetch thread while
+they download: one thread starts downloads on the event loop, up to
+async_max_in_flight at a time, and the fetch threads only settle the
+finished ones.
+"""
+import queue
+import logging
+import time
+import threading
+import traceback
+from contextlib import closing
+from engine import build_variations
+from fetchers import AsyncFetcher
+from log_setup import hot_log
+
+# How long idle workers wait on a queue before re-checking for stop/done
+POLL_INTERVAL = 0.1
+
+
+class _Job:
+    """A row in flight, with its position in the variation and candidate lists"""
+
+    def __init__(self, filename, description, output_path):
+        self.filename = filename
+        self.description = description
+        self.output_path = output_path
+        self.variations = build_variations(description)
+        self.variation_index = 0
+        self.candidates = []
+        self.candidate_index = 0
+        self.started = time.perf_counter()
+
+
+class StagedPipeline:
+    def __init__(self, batch):
+        self.batch = batch
+        settings = batch.settings
+        self.search_workers = max(1, int(settings["search_workers"]))
+        self.fetch_workers = max(1, int(settings["fetch_workers"]))
+        queue_size = max(1, int(settings["stage_queue_size"]))
+
+        self.search_queue = queue.Queue(maxsize=queue_size)
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.search_retry = queue.Queue()
+        self.fetch_retry = queue.Queue()
+        # The encode stage's queue is the transcoder's backlog, bounded by this semaphore
+        self.encode_slots = threading.BoundedSemaphore(queue_size)
+        # Downloads started on the event loop; a row holds its slot until it leaves the fetch stage
+        self.async_fetch = isinstance(batch.fetcher, AsyncFetcher)
+        self.download_slots = threading.BoundedSemaphore(max(1, int(settings["async_max_in_flight"])))
+        self.fetched = queue.SimpleQueue()
+
+        self._outstanding = 0
+        self._feeding_done = False
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+
+    def _running(self):
+        return self.batch.is_running and not self.done.is_set()
+
+    def _put(self, target, job):
+        """Blocking put that gives up when the run is stopped"""
+        while self._running():
+            try:
+                target.put(job, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _take(self, retry, main):
+        """Prefer jobs handed back from a later stage over new ones"""
+        try:
+            return retry.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return main.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            return None
+
+    def _finish(self, job, status):
+        url = variation = None
+        if status == "succeeded":
+            url = job.candidates[job.candidate_index]
+            variation = job.variations[job.variation_index]
+            self.batch.metrics.variation_won(job.variation_index)
+        else:
+            hot_log.warning("No images found for filename %s after trying variations", job.filename)
+        self.batch.finish_item(
+            job.filename, status, description=job.description, url=url, variation=variation,
+            elapsed=time.perf_counter() - job.started
+        )
+        with self._lock:
+            self._outstanding -= 1
+            if self._feeding_done and self._outstanding == 0:
+                self.done.set()
+
+    def _next_variation(self, job):
+        job.variation_index += 1
+        job.candidates = []
+        job.candidate_index = 0
+        if job.variation_index >= len(job.variations):
+            self._finish(job, "failed")
+        else:
+            self.search_retry.put(job)
+
+    def _search_worker(self):
+        while self._running():
+            job = self._take(self.search_retry, self.search_queue)
+            if job is None:
+                continue
+            try:
+                while job.variation_index < len(job.variations):
+                    variation = job.variations[job.variation_index]
+                    hot_log.info("Trying search variation: %s", variation)
+                    self.batch.metrics.variation_tried(job.variation_index)
+                    results = self.batch.search(variation, should_continue=self._running)
+                    job.candidates = self.batch.candidate_urls(results)
+                    job.candidate_index = 0
+                    if job.candidates:
+                        break
+                    job.variation_index += 1
+                if job.candidates:
+                    self._put(self.fetch_queue, job)
+                else:
+                    self._finish(job, "failed")
+            except Exception as e:
+                logging.error(f"Error in search stage for {job.filename}: {str(e)}")
+                logging.error(traceback.format_exc())
+                self._next_variation(job)
+
+    def _encode(self, job, data):
+        """Wait for room in the encode stage, then hand the bytes over; False if stopped"""
+        while not self.encode_slots.acquire(timeout=POLL_INTERVAL):
+            if not self._running():
+                return False
+        try:
+            future = self.batch.transcoder.submit(data, self.batch.max_size)
+        except Exception:
+            self.encode_slots.release()
+            raise
+        future.add_done_callback(lambda f, job=job: self._on_encoded(job, f))
+        return True
+
+    def _fetch_worker(self):
+        fetcher = self.batch.fetcher
+        while self._running():
+            job = self._take(self.fetch_retry, self.fetch_queue)
+            if job is None:
+                continue
+            try:
+                data = None
+                remaining = job.candidates[job.candidate_index:]
+                with closing(fetcher.fetch_many(remaining, self.batch.prefetch)) as downloads:
+                    for image_url, data in downloads:
+                        if not self._running():
+                            return
+                        if data:
+                            break
+                        job.candidate_index += 1
+                if not data:
+                    self._next_variation(job)
+                    continue
+                if not self._encode(job, data):
+                    return
+            except Exception as e:
+                logging.error(f"Error in fetch stage for {job.filename}: {str(e)}")
+                logging.error(traceback.format_exc())
+                self._next_variation(job)
+
+    def _start_download(self, job):
+        """Start the job's current candidate on the event loop; fetched gets it when done"""
+        url = job.candidates[job.candidate_index]
+        cached, future = self.batch.fetcher.begin(url, self._running)
+        if future is None:
+            self.fetched.put((job, url, cached, None))
+        else:
+            # Runs on the loop thread: only an unbounded put, never cache I/O
+            future.add_done_callback(lambda f: self.fetched.put((job, url, cached, f)))
+
+    def _download_starter(self):
+        """Starts a download for each row reaching the fetch stage, up to async_max_in_flight"""
+        while self._running():
+            job = self._take(self.fetch_retry, self.fetch_queue)
+            if job is None:
+                continue
+            while not self.download_slots.acquire(timeout=POLL_INTERVAL):
+                if not self._running():
+                    return
+            try:
+                self._start_download(job)
+            except Exception as e:
+                self.download_slots.release()
+                logging.error(f"Error in fetch stage for {job.filename}: {str(e)}")
+                logging.error(traceback.format_exc())
+                self._next_variation(job)
+
+    def _download_settler(self):
+        """Settles finished downloads: encode the bytes, or start the row's next candidate"""
+        fetcher = self.batch.fetcher
+        while self._running():
+            try:
+                job, url, cached, future = self.fetched.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            try:
+                data = fetcher.complete(url, cached, future)
+                if not data:
+                    job.candidate_index += 1
+                    if job.candidate_index < len(job.candidates):
+                        # Keep the row's download slot for its next candidate
+                        self._start_download(job)
+                        continue
+                self.download_slots.release()
+                if not data:
+                    self._next_variation(job)
+                elif not self._encode(job, data):
+                    return
+            except Exception as e:
+                logging.error(f"Error in fetch stage for {job.filename}: {str(e)}")
+                logging.error(traceback.format_exc())
+                self.download_slots.release()
+                self._next_variation(job)
+
+    def _on_encoded(self, job, future):
+        """Runs on the pool's callback thread; must never block on a stage queue"""
+        self.encode_slots.release()
+        if future.cancelled():
+            return
+        try:
+            if self.batch.store_image(future.result(), job.output_path):
+                self._finish(job, "succeeded")
+                return
+        except Exception as e:
+            logging.error(f"Error encoding image for {job.filename}: {str(e)}")
+        # Undecodable or duplicate candidate: try the next URL of the same variation
+        job.candidate_index += 1
+        if job.candidate_index < len(job.candidates):
+            self.fetch_retry.put(job)
+        else:
+            self._next_variation(job)
+
+    def run(self, rows):
+        """Feed rows into the search stage and wait for every row to settle"""
+        logging.info(
+            f"Staged pipeline - Search workers: {self.search_workers}, "
+            f"Fetch workers: {self.fetch_workers}, Encode processes: {self.batch.transcoder.workers}"
+            + (", downloads on the event loop" if self.async_fetch else "")
+        )
+        fetch_target = self._download_settler if self.async_fetch else self._fetch_worker
+        threads = [
+            threading.Thread(target=self._search_worker, name=f"search-{i}", daemon=True)
+            for i in range(self.search_workers)
+        ] + [
+            threading.Thread(target=fetch_target, name=f"fetch-{i}", daemon=True)
+            for i in range(self.fetch_workers)
+        ]
+        if self.async_fetch:
+            threads.append(threading.Thread(target=self._download_starter, name="fetch-start", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            for row in rows:
+                if not self._running():
+                    break
+                try:
+                    job = _Job(*self.batch.prepare_row(row))
+                except Exception as e:
+                    logging.error(f"Error processing item: {str(e)}")
+                    self.batch.finish_item(None, "failed")
+                    continue
+                hot_log.info("Processing file: %s, Description: %s", job.filename, job.description)
+                if self.batch.settle_early(job.filename, job.description, job.output_path):
+                    continue
+                with self._lock:
+                    self._outstanding += 1
+                if not self._put(self.search_queue, job):
+                    break
+
+            with self._lock:
+                self._feeding_done = True
+                if self._outstanding == 0:
+                    self.done.set()
+            while not self.done.wait(POLL_INTERVAL):
+                if not self.batch.is_running:
+                    break
+        except BaseException:
+            self.batch.stop()
+            raise
+        finally:
+            self.done.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,49 @@
+"""Exact run counters shared between worker threads and whoever displays them"""
+import threading
+from collections import namedtuple
+
+ProgressSnapshot = namedtuple("ProgressSnapshot", "total completed succeeded skipped failed")
+
+
+class ProgressStats:
+    """Row counters for a batch run.
+
+    Workers call record() as rows finish; each update is a few integer
+    additions under one short lock, so counts stay exact with any number
+    of threads. Displays read snapshot() on their own schedule instead of
+    being called per row, so their cost does not grow with the row rate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total=0):
+        with self._lock:
+            self._total = total
+            self._completed = 0
+            self._succeeded = 0
+            self._skipped = 0
+            self._failed = 0
+
+    def set_total(self, total):
+        with self._lock:
+            self._total = total
+
+    def record(self, status):
+        """Count a finished row; status is 'succeeded', 'skipped' or 'failed'"""
+        with self._lock:
+            if status == "succeeded":
+                self._succeeded += 1
+            elif status == "skipped":
+                self._skipped += 1
+            else:
+                self._failed += 1
+            self._completed += 1
+            # The up-front row count is an estimate for some sources; 0 means unknown
+            if self._total:
+                self._total = max(self._total, self._completed)
+
+    def snapshot(self):
+        with self._lock:
+            return ProgressSnapshot(self._total, self._completed, self._succeeded, self._skipped, self._failed)
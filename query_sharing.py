@@ -0,0 +1,88 @@
+"""Run-scoped sharing of search results between rows of one batch"""
+import threading
+from collections import OrderedDict
+from search_cache import SearchCache
+from log_setup import hot_log
+
+
+class _Flight:
+    """One search in progress; rows asking the same query wait on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+
+
+class QueryCoalescer:
+    """Single-flight search with results reused for the rest of the run.
+
+    Catalogs repeat descriptions, and the four-word variation collides even
+    more often. The first row to ask a query runs the search; rows asking
+    the same (normalized) query meanwhile wait for it, and rows asking later
+    get the stored results. Failed or abandoned searches are not shared: a
+    waiting row runs the search itself instead. At most max_entries results
+    are kept, least recently used first out.
+    """
+
+    def __init__(self, lookup, max_results=5, max_entries=20000):
+        self.lookup = lookup
+        self.max_results = max_results
+        self.max_entries = max_entries
+        self.searches = 0
+        self.joined = 0
+        self.reused = 0
+        self._results = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def search(self, query, should_continue=None):
+        """Return the results for query, searching only if no other row has"""
+        key = SearchCache.make_key(query, self.max_results, "")
+        while True:
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.reused += 1
+                    return self._results[key]
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.searches += 1
+
+            if leader:
+                return self._lead(key, flight, query, should_continue)
+
+            while not flight.done.wait(0.25):
+                if should_continue is not None and not should_continue():
+                    return []
+            if flight.results is not None:
+                with self._lock:
+                    self.joined += 1
+                hot_log.debug("Shared in-flight search results for query: %s", query)
+                return flight.results
+            # The leader's search failed or was abandoned; try again ourselves
+
+    def _lead(self, key, flight, query, should_continue):
+        results = None
+        try:
+            results = self.lookup(query, self.max_results, should_continue)
+        finally:
+            with self._lock:
+                if results is not None:
+                    self._results[key] = results
+                    if len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+                del self._flights[key]
+                flight.results = results
+            flight.done.set()
+        return results if results is not None else []
+
+    def saved(self):
+        """Searches avoided by joining a flight or reusing results"""
+        with self._lock:
+            return self.joined + self.reused
+
+    def stats(self):
+        with self._lock:
+            return {"searches": self.searches, "joined": self.joined, "reused": self.reused}
@@ -0,0 +1,92 @@
+"""Adaptive (AIMD) token-bucket rate limiter for DuckDuckGo searches"""
+import time
+import threading
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate adapts to the server.
+
+    Each success adds increase requests/second (additive increase). A
+    rate-limit error halves the rate (multiplicative decrease) and pauses
+    every caller for a backoff period that doubles on consecutive rate
+    limits. Errors that arrive while a backoff is already in effect come
+    from requests sent before it started, so they do not shrink the rate
+    again. The limiter then settles near the highest rate the server
+    accepts.
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=4.0, increase=0.05,
+                 decrease=0.5, burst=2, backoff_seconds=5.0, backoff_max_seconds=120.0):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.requests = 0
+        self.backoff_events = 0
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._backoff_until = 0.0
+        self._consecutive_limits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            initial_rate=float(cfg["search_rate_initial"]),
+            min_rate=float(cfg["search_rate_min"]),
+            max_rate=float(cfg["search_rate_max"]),
+            increase=float(cfg["search_rate_increase"]),
+            backoff_seconds=float(cfg["search_backoff_seconds"]),
+            backoff_max_seconds=float(cfg["search_backoff_max_seconds"])
+        )
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, should_continue=None):
+        """Block until a request may be sent; False if should_continue() turned False first"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._backoff_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.requests += 1
+                        return True
+                    wait = (1 - self._tokens) / self.rate
+            if should_continue is not None and not should_continue():
+                return False
+            # Sleep in short slices so a stop request is noticed quickly
+            time.sleep(min(wait, 0.25))
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_limits = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_rate_limited(self):
+        """Back off globally; returns the pause in seconds"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._backoff_until:
+                return self._backoff_until - now
+            self._consecutive_limits += 1
+            self.backoff_events += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = 0.0
+            self._last_refill = now
+            pause = min(self.backoff_max_seconds,
+                        self.backoff_seconds * 2 ** (self._consecutive_limits - 1))
+            self._backoff_until = now + pause
+            return pause
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "backoff_events": self.backoff_events, "rate": self.rate}
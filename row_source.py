@@ -0,0 +1,129 @@
+"""Stream (filename, description) pairs from Excel, CSV or Parquet files.
+
+Rows are yielded as they are parsed, and only the two configured columns
+are kept, so a 100k-row catalog never sits in memory as a DataFrame and
+work can start on the first row right away.
+"""
+import os
+import csv
+import logging
+from lazy_loader import LazyLoader
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv', '.parquet')
+
+
+def _cell_text(value):
+    """Cell value as text; whole floats like 12345.0 become '12345'"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _column_indexes(header, filename_column, description_column, path):
+    header = [_cell_text(name) for name in header]
+    missing = [name for name in (filename_column, description_column) if name not in header]
+    if missing:
+        raise ValueError(f"Column(s) {missing} not found in {path}. Available columns: {header}")
+    return header.index(filename_column), header.index(description_column)
+
+
+def _iter_xlsx(path, filename_column, description_column):
+    openpyxl = LazyLoader.openpyxl()
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        name_index, desc_index = _column_indexes(header, filename_column, description_column, path)
+        for row in rows:
+            if len(row) > max(name_index, desc_index):
+                yield row[name_index], row[desc_index]
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path, filename_column, description_column):
+    # utf-8-sig drops the BOM Excel writes in front of exported CSV files
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        name_index, desc_index = _column_indexes(header, filename_column, description_column, path)
+        for row in reader:
+            if len(row) > max(name_index, desc_index):
+                yield row[name_index], row[desc_index]
+
+
+def _iter_parquet(path, filename_column, description_column):
+    parquet = LazyLoader.parquet()
+    parquet_file = parquet.ParquetFile(path)
+    _column_indexes(parquet_file.schema_arrow.names, filename_column, description_column, path)
+    for batch in parquet_file.iter_batches(columns=[filename_column, description_column]):
+        yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+
+
+def _iter_xls(path, filename_column, description_column):
+    # Legacy .xls has no streaming reader; load just the two columns with pandas
+    pd = LazyLoader.pandas()
+    df = pd.read_excel(path, usecols=[filename_column, description_column], dtype=str)
+    for filename, description in zip(df[filename_column], df[description_column]):
+        yield (None if pd.isna(filename) else filename), (None if pd.isna(description) else description)
+
+
+def iter_rows(path, filename_column, description_column):
+    """Yield (filename, description) text pairs, skipping rows without a filename"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        rows = _iter_xlsx(path, filename_column, description_column)
+    elif ext == '.csv':
+        rows = _iter_csv(path, filename_column, description_column)
+    elif ext == '.parquet':
+        rows = _iter_parquet(path, filename_column, description_column)
+    elif ext == '.xls':
+        rows = _iter_xls(path, filename_column, description_column)
+    else:
+        raise ValueError(f"Unsupported file type '{ext}', expected one of {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    for filename, description in rows:
+        filename = _cell_text(filename)
+        if not filename:
+            logging.warning(f"Skipping row without a filename in {path}")
+            continue
+        yield filename, _cell_text(description)
+
+
+def count_rows(path, scan=False):
+    """Cheap row count for progress reporting; None when it cannot be known up front.
+
+    An xlsx without a dimension tag (openpyxl's write-only mode leaves it
+    out) can only be counted by reading the whole sheet, which scan allows.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in ('.xlsx', '.xlsm'):
+            openpyxl = LazyLoader.openpyxl()
+            workbook = openpyxl.load_workbook(path, read_only=True)
+            try:
+                # Read from the sheet's dimension tag, not by scanning rows
+                sheet = workbook.active
+                max_row = sheet.max_row
+                if max_row is None and scan:
+                    sheet.reset_dimensions()
+                    sheet.calculate_dimension(force=True)
+                    max_row = sheet.max_row
+            finally:
+                workbook.close()
+            return max_row - 1 if max_row else None
+        if ext == '.csv':
+            with open(path, 'rb') as f:
+                newlines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+            return max(newlines - 1, 0)
+        if ext == '.parquet':
+            return LazyLoader.parquet().ParquetFile(path).metadata.num_rows
+    except Exception as e:
+        logging.error(f"Error counting rows in {path}: {str(e)}")
+    return None
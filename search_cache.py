@@ -0,0 +1,103 @@
+"""Persistent query -> results cache for DuckDuckGo image searches"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+
+class SearchCache:
+    """SQLite-backed cache of search results with a TTL and a bounded size.
+
+    Keys are the normalized query plus max_results and safesearch, so
+    "Red  Mug" and "red mug" share one entry. When the table grows past
+    max_entries the least recently used rows are evicted.
+    """
+
+    # Evicting on every put would mean a COUNT(*) per search
+    EVICT_EVERY = 100
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=50000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_results ("
+            " key TEXT PRIMARY KEY,"
+            " results TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_search_results_last_used ON search_results(last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(query, max_results, safesearch):
+        """Normalize the query so whitespace and case differences hit the same entry"""
+        normalized = " ".join(str(query).lower().split())
+        return f"{normalized}|{max_results}|{safesearch}"
+
+    def get(self, query, max_results, safesearch):
+        """Return cached results, or None on a miss or an expired entry"""
+        key = self.make_key(query, max_results, safesearch)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM search_results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_results SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, max_results, safesearch, results):
+        """Store results for a query, evicting old entries if the cache is full"""
+        key = self.make_key(query, max_results, safesearch)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, results, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), now, now)
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM search_results WHERE created < ?", (time.time() - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM search_results WHERE key IN "
+                "(SELECT key FROM search_results ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            logging.info(f"Evicted {excess} entries from search cache")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,80 @@
+"""Persistent gallery thumbnails kept in a sidecar directory next to the images"""
+import os
+import hashlib
+import logging
+from io import BytesIO
+from lazy_loader import LazyLoader
+from imaging import load_image
+from atomic_files import write_atomic
+
+THUMBNAIL_DIRNAME = ".thumbnails"
+THUMBNAIL_SIZE = 200
+
+
+class ThumbnailStore:
+    """Small JPEG thumbnails keyed by image name, mtime and size.
+
+    A thumbnail lives at .thumbnails/<h[:2]>/<h>-<mtime_ns>-<size>.jpg,
+    where h hashes the image's file name, so replacing an image (which
+    changes its mtime or size) makes its old thumbnail a miss, and the old
+    file is removed when the new one is written. Batch runs write a
+    thumbnail for each image they save, made by the encode worker from the
+    resized image, so opening the gallery afterwards only reads small files.
+    """
+
+    QUALITY = 80
+
+    def __init__(self, output_dir, size=THUMBNAIL_SIZE):
+        self.directory = os.path.join(output_dir, THUMBNAIL_DIRNAME)
+        self.size = size
+
+    def _prefix(self, image_path):
+        return hashlib.sha1(os.path.basename(image_path).encode('utf-8')).hexdigest()
+
+    def _path(self, image_path, stat):
+        prefix = self._prefix(image_path)
+        return os.path.join(self.directory, prefix[:2], f"{prefix}-{stat.st_mtime_ns}-{stat.st_size}.jpg")
+
+    def get(self, image_path):
+        """The stored thumbnail for the image as it is on disk now, or None"""
+        try:
+            img = LazyLoader.image().open(self._path(image_path, os.stat(image_path)))
+            img.load()
+            return img
+        except OSError:
+            return None
+
+    def put(self, image_path, img):
+        """Store a thumbnail (already at most size pixels) for the image's current version"""
+        output = BytesIO()
+        img.save(output, "JPEG", quality=self.QUALITY)
+        self.put_bytes(image_path, output.getvalue())
+
+    def put_bytes(self, image_path, data):
+        """Store already-encoded thumbnail JPEG bytes for the image's current version"""
+        path = self._path(image_path, os.stat(image_path))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Drop thumbnails of earlier versions of this image
+        prefix = self._prefix(image_path)
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+        write_atomic(path, data)
+
+    def load(self, image_path):
+        """The thumbnail for the image, making and storing it first if needed"""
+        img = self.get(image_path)
+        if img is not None:
+            return img
+        img = load_image(image_path, self.size)
+        try:
+            self.put(image_path, img)
+        except Exception as e:
+            logging.error(f"Error storing thumbnail for {image_path}: {str(e)}")
+        return img